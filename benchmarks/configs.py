@@ -0,0 +1,119 @@
+# Synthetic configs for the benchmarks, built from stdlib classes so that nothing heavy has to be installed.
+# Every top level object is a collections.UserDict with `fanout` params. The first param nests another object,
+# `depth` levels deep. The other params are either constants, placeholders (placeholder_density: references to
+# earlier objects, or templates of the save_dir value), or method calls on earlier objects (method_density).
+# The experiment calls a method of the last object.
+
+import random
+from typing import Any
+
+CLASS = {"module": "collections", "class_name": "UserDict"}
+
+# given in the key map, like the save_dir of an experiment
+VALUES = {"save_dir": "/tmp/bombilla-benchmark"}
+
+
+def synthetic_config(
+    objects: int = 100,
+    depth: int = 1,
+    fanout: int = 4,
+    method_density: float = 0.1,
+    placeholder_density: float = 0.2,
+    seed: int = 0,
+) -> dict[str, Any]:
+    rng = random.Random(seed)
+
+    def value(i: int, key: str) -> Any:
+        draw = rng.random()
+        if i > 0 and draw < method_density:
+            return {
+                "reference_key": f"o{rng.randrange(i)}",
+                "function_call": "get",
+                "params": {"key": key},
+            }
+        if i > 0 and draw < method_density + placeholder_density:
+            if rng.random() < 0.5:
+                return "{" + f"o{rng.randrange(i)}" + "}"
+            return "{save_dir}/" + key
+        return rng.choice([rng.randrange(1000), key * 2, 0.5, True, None])
+
+    def params(i: int, level: int) -> dict[str, Any]:
+        result = {}
+        for p in range(fanout):
+            key = f"p{p}"
+            if p == 0 and level < depth:
+                result[key] = dict(CLASS, params=params(i, level + 1))
+            else:
+                result[key] = value(i, key)
+        return result
+
+    config = {
+        "objects": {
+            f"o{i}": dict(CLASS, object_key=f"o{i}", params=params(i, 0)) for i in range(objects)
+        },
+        "experiment": {
+            "train": [
+                {
+                    "reference_key": f"o{objects - 1}",
+                    "function_call": "get",
+                    "params": {"key": "p1"},
+                }
+            ]
+        },
+    }
+    return config
+
+
+def synthetic_python(config: dict[str, Any]) -> str:
+    # the same config in the python format (see test_bombillas/default.py)
+    def render(val: Any) -> str:
+        if isinstance(val, dict) and "class_name" in val:
+            return f"UserDict({render_params(val.get('params', {}))})"
+        elif isinstance(val, dict) and "function_call" in val:
+            return f"{val['reference_key']}.{val['function_call']}({render_params(val['params'])})"
+        elif isinstance(val, dict):
+            return "{" + ", ".join(f"{key!r}: {render(v)}" for key, v in val.items()) + "}"
+        elif isinstance(val, list):
+            return "[" + ", ".join(render(v) for v in val) + "]"
+        elif isinstance(val, str) and val.startswith("{"):
+            reference, rest = val[1:].split("}", 1)
+            return reference if not rest else f'f"{{{reference}}}{rest}"'
+        return repr(val)
+
+    def render_params(params: dict[str, Any]) -> str:
+        return ", ".join(f"{key}={render(val)}" for key, val in params.items())
+
+    lines = [
+        "from collections import UserDict",
+        "import os",
+        "import sys",
+        "",
+        'save_dir: str = os.environ.get("SAVE_DIR")',
+        "command: str = sys.argv[1]",
+    ]
+    for key, val in config["objects"].items():
+        lines.append(f"{key} = {render(val)}")
+    lines.append("")
+    for i, (command, calls) in enumerate(config["experiment"].items()):
+        lines.append(f"{'if' if i == 0 else 'elif'} command == {command!r}:")
+        lines.extend(f"    {render(call)}" for call in calls)
+    return "\n".join(lines) + "\n"
+
+
+def node_count(config: Any) -> int:
+    # objects, function and method calls of the config
+    if isinstance(config, dict):
+        own = 1 if "module" in config or "function_call" in config else 0
+        return own + sum(node_count(val) for val in config.values())
+    elif isinstance(config, list):
+        return sum(node_count(val) for val in config)
+    return 0
+
+
+def config_for_nodes(nodes: int, **kwargs) -> dict[str, Any]:
+    # a config with about `nodes` nodes, the number of objects follows from depth and method_density
+    depth = kwargs.get("depth", 1)
+    fanout = kwargs.get("fanout", 4)
+    method_density = kwargs.get("method_density", 0.1)
+    per_object = 1 + depth + (fanout - 1) * method_density * (depth + 1)
+    return synthetic_config(objects=max(1, round(nodes / per_object)), **kwargs)
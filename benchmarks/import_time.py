@@ -0,0 +1,88 @@
+# Cold import time of the bombilla package, measured with `python -X importtime -c "import bombilla"` in fresh
+# interpreters and checked against a budget. Also checks that the optional subsystems (debugger, toml export,
+# docstring parsing, the DAG and the python config parser) are not imported by `import bombilla`.
+#
+#   python benchmarks/import_time.py [--budget 150] [--runs 10] [--top 15]
+#
+# Exits with status 1 when the median import time is over the budget or a lazy module was imported.
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+PACKAGES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "packages")
+
+# budget for the median cumulative import time of bombilla, in milliseconds
+BUDGET_MS = 150
+
+LAZY_MODULES = (
+    "ipdb",
+    "IPython",
+    "toml",
+    "docstring_parser",
+    "regex",
+    "subprocess",
+    "bombilla.bombilla_dag.bombilla_dag",
+    "bombilla.bombilla_dag.python_to_dict",
+)
+
+
+def import_times() -> list[tuple[str, int, int]]:
+    # (module, self us, cumulative us) of every module imported by `import bombilla`, in import order
+    env = dict(os.environ, PYTHONPATH=PACKAGES + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import bombilla"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        times.append((name.strip(), int(self_us), int(cumulative_us)))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=BUDGET_MS, help="budget in ms")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    args = parser.parse_args()
+
+    # the first run compiles the bytecode, it is not measured
+    import_times()
+    runs = [import_times() for _ in range(args.runs)]
+    totals = [dict((name, cumulative) for name, _, cumulative in run)["bombilla"] / 1000 for run in runs]
+    median = statistics.median(totals)
+
+    last = runs[-1]
+    print(f"import bombilla: median {median:.1f} ms, min {min(totals):.1f} ms, max {max(totals):.1f} ms")
+    print(f"budget {args.budget:.0f} ms, {len(last)} modules imported")
+    print("\nslowest modules (self time, last run):")
+    for name, self_us, cumulative_us in sorted(last, key=lambda t: -t[1])[: args.top]:
+        print(f"  {self_us / 1000:>7.2f} ms  {cumulative_us / 1000:>7.2f} ms cumulative  {name}")
+
+    imported = {name for name, _, _ in last}
+    eager = [
+        module
+        for module in LAZY_MODULES
+        if any(name == module or name.startswith(module + ".") for name in imported)
+    ]
+    failed = False
+    if eager:
+        print(f"\nimported by `import bombilla` but should be lazy: {', '.join(eager)}")
+        failed = True
+    if median > args.budget:
+        print(f"\nover budget by {median - args.budget:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
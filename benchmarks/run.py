@@ -0,0 +1,170 @@
+# Time and peak memory of the hot paths of bombilla on synthetic configs (see configs.py) of 10 to 100k nodes:
+# python_to_dict, BombillaDAG construction, to_dict, to_json, to_py, Bombilla.load, Bombilla.execute and
+# generate_full_dict. Every phase first runs once untimed (so that the modules imported lazily aren't charged
+# to it), times are the best of --repeat runs, the peak memory (tracemalloc) is measured in a separate run so
+# that tracing doesn't slow down the timed ones.
+#
+#   python benchmarks/run.py [--sizes 10,100,1000,10000,100000] [--repeat 3] [--depth 1] [--fanout 4]
+#                            [--method-density 0.1] [--placeholder-density 0.2] [--phases load,execute]
+#                            [--save NAME] [--compare NAME] [--threshold 1.5] [--min-time 5]
+#
+# --save writes the results to benchmarks/baselines/NAME.json, --compare prints the ratios against a saved
+# baseline and exits with status 1 when a phase is slower than threshold times the baseline. Phases that took
+# less than --min-time ms in both runs are too noisy to fail the comparison.
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+from typing import Any, Callable, Optional
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+BASELINES = os.path.join(BENCHMARKS, "baselines")
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS), "packages"))
+
+from bombilla import Bombilla
+from bombilla.bombilla_dag.bombilla_dag import BombillaDAG
+from bombilla.bombilla_dag.python_to_dict import python_to_dict
+from configs import VALUES, config_for_nodes, node_count, synthetic_python
+
+SIZES = (10, 100, 1000, 10000, 100000)
+
+# to_py writes and formats the whole file (with black when it is installed), it is too slow for the largest
+# configs
+MAX_NODES = {"to_py": 20000}
+
+# phases are run on a fresh config every time, setup isn't measured: name -> (setup, phase)
+PHASES: dict[str, tuple[Callable[[dict, str], Any], Callable[[Any], Any]]] = {
+    "python_to_dict": (lambda config, source: source, python_to_dict),
+    "dag": (lambda config, source: config, BombillaDAG),
+    "to_dict": (lambda config, source: BombillaDAG(config), lambda dag: dag.to_dict()),
+    "to_json": (lambda config, source: BombillaDAG(config), lambda dag: dag.to_json()),
+    "to_py": (lambda config, source: BombillaDAG(config), lambda dag: dag.to_py()),
+    "load": (lambda config, source: Bombilla(config, object_key_map=dict(VALUES)), lambda b: b.load()),
+    "execute": (lambda config, source: loaded(config), lambda b: b.execute("train")),
+    "generate_full_dict": (
+        lambda config, source: Bombilla(config, object_key_map=dict(VALUES)),
+        lambda b: b.generate_full_dict(),
+    ),
+}
+
+
+def loaded(config: dict) -> Bombilla:
+    bombilla = Bombilla(config, object_key_map=dict(VALUES))
+    bombilla.load()
+    return bombilla
+
+
+def measure(phase: str, config: dict, source: str, repeat: int) -> dict[str, float]:
+    setup, run = PHASES[phase]
+    run(setup(config, source))
+    seconds = float("inf")
+    for _ in range(repeat):
+        arg = setup(config, source)
+        start = time.perf_counter()
+        run(arg)
+        seconds = min(seconds, time.perf_counter() - start)
+
+    arg = setup(config, source)
+    tracemalloc.start()
+    try:
+        run(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": seconds, "peak_bytes": peak}
+
+
+def run_benchmarks(args: argparse.Namespace) -> dict[str, dict[str, dict[str, float]]]:
+    results: dict[str, dict[str, dict[str, float]]] = {}
+    for size in args.sizes:
+        config = config_for_nodes(
+            size,
+            depth=args.depth,
+            fanout=args.fanout,
+            method_density=args.method_density,
+            placeholder_density=args.placeholder_density,
+        )
+        source = synthetic_python(config)
+        nodes = node_count(config)
+        print(f"\n{size} nodes ({nodes} in the config, {len(config['objects'])} objects)")
+        results[str(size)] = {}
+        for phase in args.phases:
+            if nodes > MAX_NODES.get(phase, nodes):
+                continue
+            result = measure(phase, config, source, args.repeat)
+            results[str(size)][phase] = result
+            print(
+                f"  {phase:<20} {result['seconds'] * 1000:>10.2f} ms"
+                f" {result['peak_bytes'] / 2**20:>10.2f} MiB peak"
+            )
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_time: float) -> bool:
+    # prints the time ratios against the baseline, True when none is over the threshold
+    ok = True
+    print(f"\ncompared to the baseline ({baseline['python']}, {baseline['machine']}):")
+    for size, phases in results.items():
+        for phase, result in phases.items():
+            base: Optional[dict] = baseline["results"].get(size, {}).get(phase)
+            if base is None:
+                continue
+            ratio = result["seconds"] / base["seconds"]
+            memory = result["peak_bytes"] / max(base["peak_bytes"], 1)
+            slower = ratio > threshold and max(result["seconds"], base["seconds"]) >= min_time
+            ok = ok and not slower
+            print(
+                f"  {size:>7} {phase:<20} time x{ratio:.2f}  memory x{memory:.2f}"
+                + ("  SLOWER" if slower else "")
+            )
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=lambda s: [int(n) for n in s.split(",")], default=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--depth", type=int, default=1)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--method-density", type=float, default=0.1)
+    parser.add_argument("--placeholder-density", type=float, default=0.2)
+    parser.add_argument("--phases", type=lambda s: s.split(","), default=list(PHASES))
+    parser.add_argument("--save", help="save the results as benchmarks/baselines/NAME.json")
+    parser.add_argument("--compare", help="compare with benchmarks/baselines/NAME.json")
+    parser.add_argument("--threshold", type=float, default=1.5, help="slowdown that fails --compare")
+    parser.add_argument(
+        "--min-time", type=float, default=5, help="ms under which a phase doesn't fail --compare"
+    )
+    args = parser.parse_args()
+    for phase in args.phases:
+        assert phase in PHASES, f"Unknown phase {phase}, use some of {list(PHASES)}"
+
+    results = run_benchmarks(args)
+
+    if args.save:
+        os.makedirs(BASELINES, exist_ok=True)
+        with open(os.path.join(BASELINES, f"{args.save}.json"), "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "parameters": {
+                        key: val for key, val in vars(args).items() if key not in ("save", "compare")
+                    },
+                    "results": results,
+                },
+                f,
+                indent=4,
+            )
+    if args.compare:
+        with open(os.path.join(BASELINES, f"{args.compare}.json")) as f:
+            baseline = json.load(f)
+        sys.exit(0 if compare(results, baseline, args.threshold, args.min_time / 1000) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,4 @@
 from .bombilla import Bombilla
-import ipdb
 import os
 
 
@@ -7,6 +6,8 @@ def main():
     bombilla = Bombilla.from_json(
         os.path.join(os.path.dirname(__file__), "./test_bombillas/default.json")
     )
+    import ipdb
+
     ipdb.set_trace()
 
 
@@ -0,0 +1,57 @@
+# Runs many (config file, command) jobs on a pool of worker processes, each worker builds its own Bombilla
+
+import os
+import pickle
+import time
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+
+from .bombilla import Bombilla
+
+
+def run_job(filename: str, command: str = "train", root_module: str = "") -> dict[str, Any]:
+    start = time.perf_counter()
+    result: dict[str, Any] = {
+        "filename": filename,
+        "command": command,
+        "pid": os.getpid(),
+    }
+    try:
+        # a fresh key map, workers are reused and must not see the objects of the previous job
+        bombilla = Bombilla.from_file(filename, root_module, {})
+        bombilla.load()
+        returns = bombilla.execute(command)
+        result["status"] = 0
+        result["returns"] = [picklable(value) for value in returns]
+    except Exception as err:
+        result["status"] = 1
+        result["error"] = "".join(traceback.format_exception(err))
+    result["wall_time"] = time.perf_counter() - start
+    return result
+
+
+def picklable(value: Any) -> Any:
+    # return values travel back to the parent process, the ones that can't be pickled are sent as their repr
+    try:
+        pickle.dumps(value)
+        return value
+    except Exception:
+        return repr(value)
+
+
+def run_batch(
+    jobs: list[tuple[str, str]],
+    workers: Optional[int] = None,
+    root_module: str = "",
+    start_method: Optional[str] = None,
+) -> list[dict[str, Any]]:
+    # results are returned in the same order as the jobs
+    context = multiprocessing.get_context(start_method)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [
+            pool.submit(run_job, filename, command, root_module)
+            for filename, command in jobs
+        ]
+        return [future.result() for future in futures]
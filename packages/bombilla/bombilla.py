@@ -1,8 +1,25 @@
 # Bambilla, API for bamiblla json format and python objects
 
+import os
+import json
+from typing import TYPE_CHECKING, Any, Optional
 from .node import Node, NodeDict, ExperimentNode
-import ipdb
-from .bombilla_dag.bombilla_dag import BombillaDAG
+from .scheduler import (
+    build_objects,
+    execute_objects,
+    object_dependencies,
+    object_dependents,
+    object_owners,
+)
+from .compiler import ExecutionPlan, compile_plan
+from .utils.metadata import flush_metadata
+from .utils.config_cache import config_key, load_config, store_config
+from .utils.overrides import override_config
+from .utils.imports import find_module_names, module_candidates, prefetch_modules
+
+if TYPE_CHECKING:
+    # the DAG and the python config parser are imported when first used, executing a json config needs neither
+    from .bombilla_dag.bombilla_dag import BombillaDAG
 
 
 
@@ -12,41 +29,227 @@ class Bombilla(dict):
         bombilla_dict: dict,
         root_module: str = "",
         object_key_map: dict = {},
+        prefetch_imports: bool = False,
+        dag: Optional["BombillaDAG"] = None,
     ) -> None:
 
-        self.dag = BombillaDAG(bombilla_dict)
         assert isinstance(bombilla_dict, dict), "Bambilla must be a dict"
+        if os.environ.get("BOMBILLA_TRACE"):
+            from .utils.tracing import trace_until_exit
+
+            trace_until_exit(os.environ["BOMBILLA_TRACE"])
+        # the runtime nodes and the DAG (built on first use) read this same dict
+        self._config = bombilla_dict
+        self._root_module = root_module
+        self._dag = dag
+        self._modules: Optional[list[tuple[str, Optional[str]]]] = None
+        if prefetch_imports:
+            Bombilla.prefetch_imports(bombilla_dict, root_module)
 
         Node.set_config(root_module, object_key_map)
         self.root_node = ExperimentNode(dict(bombilla_dict))
+        # top level objects kept by update, execute doesn't build them again
+        self._reused: set[str] = set()
+
+    def derive(self, overrides: dict, object_key_map: dict = {}) -> "Bombilla":
+        # the same config with the overrides ({"objects.model.params.lr": 0.1}) applied, the unchanged parts
+        # of the config are shared with this one
+        return Bombilla(
+            override_config(self._config, overrides), self._root_module, object_key_map
+        )
+
+    def update(self, bombilla_dict: dict) -> dict[str, str]:
+        # replaces the config by a changed one, keeping the objects already built whose config is the same and
+        # that don't refer (directly or not) to a changed object. The next execute builds only the others.
+        # Returns the top level objects that will be built again, or are gone, with the reason
+        # ("added", "changed", "removed" or "uses <key>")
+        assert isinstance(bombilla_dict, dict), "Bambilla must be a dict"
+        old_objects = self._config.get("objects", {})
+        new_objects = bombilla_dict.get("objects", {})
+
+        changed = {}
+        for key, value in new_objects.items():
+            if key not in old_objects:
+                changed[key] = "added"
+            elif old_objects[key] is not value and old_objects[key] != value:
+                changed[key] = "changed"
+        from .bombilla_dag.bombilla_dag import BombillaDAG
+
+        dag = BombillaDAG(bombilla_dict)
+        stale = object_dependents(
+            object_dependencies(dag, list(new_objects)), set(changed)
+        )
+        report = {
+            key: changed[key] if source is None else f"uses {source}"
+            for key, source in stale.items()
+        }
+        report.update({key: "removed" for key in old_objects if key not in new_objects})
+
+        # the objects of the stale and removed keys, and the ones nested in them, leave the key map
+        owners = object_owners(self.dag, list(old_objects))
+        for object_key, owner in owners.items():
+            if owner in report:
+                Node._key_value_map.pop(object_key, None)
+                Node._key_nodes.pop(object_key, None)
+
+        old_objects_node = self.root_node._objects_node
+        loaded = old_objects_node._loaded
+        self._config = bombilla_dict
+        self._dag = dag
+        self._modules = None
+        self.root_node = ExperimentNode(dict(bombilla_dict))
+        self._reused = {
+            key
+            for key in new_objects
+            if key not in report and key in Node._key_value_map
+        }
+        if loaded:
+            # the nodes of the kept objects hold their python objects (find, execute_method)
+            self.load()
+            objects_node = self.root_node._objects_node
+            for key in self._reused:
+                node = old_objects_node._node_key_dict.get(key)
+                if isinstance(node, Node):
+                    setattr(objects_node, key, node)
+                    objects_node._node_key_dict[key] = node
+        return report
+
+    @property
+    def dag(self) -> "BombillaDAG":
+        # only needed by the graph features (execute with max_workers, the DAG api), loading doesn't build it
+        if self._dag is None:
+            from .bombilla_dag.bombilla_dag import BombillaDAG
+
+            self._dag = BombillaDAG(self._config)
+        return self._dag
+
+    @staticmethod
+    def prefetch_imports(config: dict, root_module: str = ""):
+        # starts importing, on background threads, the modules of the config while it is still being parsed
+        return prefetch_modules(
+            [
+                (module_candidates(module, root_module), symbol)
+                for module, symbol in config_modules(config)
+            ]
+        )
 
     @classmethod
-    def from_file(cls, filename: str, root_module: str = "", object_key_map: dict = {}):
-        return cls(
-            BombillaDAG.from_file(filename).to_dict(), root_module, object_key_map
+    def from_file(
+        cls,
+        filename: str,
+        root_module: str = "",
+        object_key_map: dict = {},
+        prefetch_imports: bool = False,
+        cache: bool = False,
+    ):
+        if filename.endswith(".json"):
+            kind = "json"
+        elif filename.endswith(".py"):
+            kind = "py"
+        else:
+            raise ValueError("File extension not supported")
+        return cls.__from_source_file(
+            filename, kind, root_module, object_key_map, prefetch_imports, cache
         )
 
     @classmethod
     def from_py_string(
-        cls, py_string: str, root_module: str = "", object_key_map: dict = {}
+        cls,
+        py_string: str,
+        root_module: str = "",
+        object_key_map: dict = {},
+        prefetch_imports: bool = False,
     ):
-        return cls(
-            BombillaDAG.from_py_string(py_string).to_dict(), root_module, object_key_map
-        )
+        from .bombilla_dag.python_to_dict import python_to_dict
+
+        config, dag = cls.__normalize(python_to_dict(py_string), root_module, prefetch_imports)
+        return cls(config, root_module, object_key_map, dag=dag)
 
     @classmethod
     def from_py_file(
-        cls, filename: str, root_module: str = "", object_key_map: dict = {}
+        cls,
+        filename: str,
+        root_module: str = "",
+        object_key_map: dict = {},
+        prefetch_imports: bool = False,
+        cache: bool = False,
     ):
-        dag = BombillaDAG.from_py_file(filename)
-        return cls(dag.to_dict(), root_module, object_key_map)
+        return cls.__from_source_file(
+            filename,
+            "py",
+            root_module,
+            object_key_map,
+            prefetch_imports,
+            cache,
+        )
 
     @classmethod
     def from_json_file(
-        cls, filename: str, root_module: str = "", object_key_map: dict = {}
+        cls,
+        filename: str,
+        root_module: str = "",
+        object_key_map: dict = {},
+        prefetch_imports: bool = False,
+        cache: bool = False,
     ):
-        dag = BombillaDAG.from_json_file(filename)
-        return cls(dag.to_dict(), root_module, object_key_map)
+        return cls.__from_source_file(
+            filename,
+            "json",
+            root_module,
+            object_key_map,
+            prefetch_imports,
+            cache,
+        )
+
+    @classmethod
+    def __from_source_file(
+        cls,
+        filename: str,
+        kind: str,
+        root_module: str,
+        object_key_map: dict,
+        prefetch_imports: bool,
+        cache: bool,
+    ):
+        # with cache, the normalized config is stored on disk and later launches of the same source skip parsing it
+        with open(filename, "rb") as f:
+            source = f.read()
+        key = config_key(source, kind) if cache else None
+        config = load_config(key) if cache else None
+        if config is not None:
+            return cls(config, root_module, object_key_map, prefetch_imports)
+
+        if kind == "json":
+            content = json.loads(source)
+        else:
+            from .bombilla_dag.python_to_dict import python_to_dict
+
+            content = python_to_dict(source.decode())
+        config, dag = cls.__normalize(content, root_module, prefetch_imports)
+        if cache:
+            store_config(key, config)
+        return cls(config, root_module, object_key_map, dag=dag)
+
+    @classmethod
+    def __normalize(
+        cls, content: dict, root_module: str, prefetch_imports: bool
+    ) -> tuple[dict, Optional["BombillaDAG"]]:
+        # the freshly parsed content is normalized by the only BombillaDAG built for it. The DAG is kept when
+        # its paths are the ones of the normalized config: the config was already in the
+        # {"objects", "experiment"} format and no nested object was moved to the top level.
+        if prefetch_imports:
+            cls.prefetch_imports(content, root_module)
+        object_keys = (
+            set(content["objects"])
+            if isinstance(content.get("objects"), dict)
+            and set(content) <= {"objects", "experiment"}
+            else None
+        )
+        from .bombilla_dag.bombilla_dag import BombillaDAG
+
+        dag = BombillaDAG(content)
+        config = dag.to_dict()
+        return config, dag if object_keys == set(config["objects"]) else None
 
     @classmethod
     def from_string(
@@ -58,20 +261,54 @@ class Bombilla(dict):
 
     @classmethod
     def format_json(cls, filename: str):
+        from .bombilla_dag.bombilla_dag import BombillaDAG
+
         BombillaDAG.format_json(filename)
 
     @classmethod
     def from_raw(cls, content: str):
         pass
 
+    def find_modules(self):
+        # resolves the names of all the modules referenced by the config in one pass, before they are imported
+        # (only their parent packages are, see find_module_names)
+        root_module = Node._root_module
+        if self._modules is None:
+            self._modules = config_modules(self._config)
+        find_module_names(
+            {module_candidates(module, root_module) for module, _ in self._modules}
+        )
+
     def load(self):
+        self.find_modules()
         self.root_node.__load__()
 
-    def execute(self, type: str = "train"):
-        self.root_node.__call__()
-        self.root_node.execute_experiment(type)
+    def execute(self, type: str = "train", max_workers: Optional[int] = None):
+        # with max_workers the independent objects are built concurrently on a thread pool
+        try:
+            if max_workers is not None:
+                built = {key: Node._key_value_map[key] for key in self._reused}
+                execute_objects(self.root_node, self.dag, max_workers, built)
+            elif self._reused:
+                build_objects(
+                    self.root_node,
+                    set(self.root_node._objects_node._original_keys) - self._reused,
+                )
+            else:
+                self.root_node.__call__()
+            return self.root_node.execute_experiment(type)._results
+        finally:
+            flush_metadata()
+
+    def compile(self, type: Optional[str] = "train", share: bool = False) -> ExecutionPlan:
+        # flat plan of the config, plan.run() builds the objects and returns the results of the command.
+        # With share, identical nodes marked "shared": true are built once (plan.shared counts the others)
+        self.find_modules()
+        self.root_node.__load__()
+        return compile_plan(self.root_node, type, share)
 
     def generate_full_dict(self):
+        self.find_modules()
         self.root_node.__load__()
 
         return self.root_node.generate_full_dict()
@@ -108,3 +345,23 @@ class Bombilla(dict):
 
     def find(self, object_name: str):
         return Node._key_value_map[object_name]
+
+
+def config_modules(config: Any) -> list[tuple[str, Optional[str]]]:
+    # (module, imported symbol) of every node of the config that imports something, in the order of the config
+    modules = []
+    stack = [config]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            if isinstance(value.get("module"), str):
+                symbol = (
+                    value.get("class_name")
+                    or value.get("class_type")
+                    or value.get("function")
+                )
+                modules.append((value["module"], symbol))
+            stack.extend(reversed(list(value.values())))
+        elif isinstance(value, list):
+            stack.extend(reversed(value))
+    return modules
@@ -1,10 +1,7 @@
 from typing import Any
 import os
-import re
 import random
 import json
-import ipdb
-import subprocess
 from .nodes import (
     Node,
     ValueNode,
@@ -13,16 +10,20 @@ from .nodes import (
     ClassTypeNode,
     ReturnNode,
     FunctionCall,
+    Edge,
 )
 from .dag import DAG
 from .python_to_dict import python_to_dict
+from ..utils.template import references
+from ..utils.overrides import REMOVE
+from ..utils.debug import set_trace
+import hashlib
 import ast
-from copy import deepcopy
 
 
 class BombillaDAG(DAG):
     def __init__(self, bombilla_dict: dict[str, Any]):
-        bombilla_dict = deepcopy(bombilla_dict)
+        # the dict is not modified, nor copied: nodes copy the parts of it they write to (see Node.assign)
         super().__init__()
         self.__from_dict(bombilla_dict, [], None)
         self.__flatten()
@@ -112,10 +113,11 @@ class BombillaDAG(DAG):
                     parent = self.path_parent(node)
                     assert parent is not None
                     parent.assign(node.path, "{" + node.object_key + "}")
+                    self.invalidate(parent)
                     # self.root.assign([node.object_key], node)
                     edge = self.path_edge_to(node)
                     assert edge is not None
-                    self.path_edges.remove(edge)
+                    self.remove_path_edge(edge)
                     self.add_path_edge(self.root, node)
                 for child in self.path_children(node):
                     path_walk(child, node)
@@ -124,13 +126,14 @@ class BombillaDAG(DAG):
 
     def __from_dict(self, bomb: Any, path: list[str], parent: Node | None):
         if self.__is_simple_type(bomb):
-            assert parent is not None, ipdb.set_trace()
-            ref = self.__get_ref(bomb)
-            if ref is not None:
-                if ref in ("save_dir",):
+            assert parent is not None, set_trace()
+            for ref in references(bomb):
+                if ref in ("save_dir",) and ref not in self:
                     self.add_node(ValueNode(ref, path))
-                self.add_edge(ref, parent, path)
+                if not Edge(ref, parent) in self:
+                    self.add_edge(ref, parent, path)
             parent.assign(path, bomb)
+            self.invalidate(parent)
         elif ReturnNode.is_one(bomb):
             node = ReturnNode(object_key=path[-1], path=path)
             self.add_node(node)
@@ -171,10 +174,17 @@ class BombillaDAG(DAG):
                 assert isinstance(bomb["params"], dict)
                 for key, val in bomb["params"].items():
                     self.__from_dict(val, path + ["params", key], function_call)
+            elif "reference_key" in bomb:
+                # a bare reference to an object ({"reference_key": "a"}) is kept as it is, with its edge
+                assert parent is not None
+                if not Edge(bomb["reference_key"], parent) in self:
+                    self.add_edge(bomb["reference_key"], parent, path)
+                parent.assign(path, bomb)
+                self.invalidate(parent)
             elif "module" in bomb:
                 node: Node | None = None
                 if ((not len(path)) >= 2) and (path[-2] == "params"):
-                    bomb["object_key"] = path[-2] + "_" + self.__rand_hex(5)
+                    bomb = dict(bomb, object_key=path[-2] + "_" + self.__rand_hex(5))
                 if ClassNameNode.is_one(bomb):
                     node = ClassNameNode.from_dict(bomb, path)
                 else:
@@ -186,7 +196,6 @@ class BombillaDAG(DAG):
                 if parent is not None:
                     parent.assign(path, node)  # "{" + bomb["object_key"] + "}")
                     self.add_edge(node, parent, path)  # done
-                bomb["path"] = path
                 # self.add_node(parent)
                 if "params" in bomb:
                     for key, val in bomb["params"].items():
@@ -207,23 +216,122 @@ class BombillaDAG(DAG):
                 for key, val in bomb.items():
                     self.__from_dict(val, path + [key], parent)
 
-    def object_keys(self) -> list[str]:
-        return [node.object_key for node in self.__nodes.values()]
+    def add_object(self, object_key: str, bomb: dict[str, Any]) -> Node:
+        assert not object_key in self, f"Node with {object_key=} already present"
+        assert ClassNameNode.is_one(bomb), f"Object {object_key} must have a module and a class_name"
+        bomb = dict(bomb, object_key=object_key)
+        self.__from_dict(bomb, ["objects", object_key], None)
+        return self[object_key]
 
-    def remove_node(self, node: Node | str):
+    def replace_node(self, node: Node | str, with_node: Node | dict[str, Any]) -> Node:
+        # the replacement is a bombilla dict (nodes are converted with to_dict), the objects nested in it are
+        # parsed. It is checked before anything is dropped, a failed replace leaves the DAG as it was
         object_key = node if isinstance(node, str) else node.object_key
         assert object_key in self, f"No node with {object_key=}"
-        del self.__nodes[object_key]
-        children = self.children(object_key)
-        self.edges = [edge for edge in self.edges if edge.from_key != object_key]
-        for child in children:
-            self.remove_node(child)
+        old = self[object_key]
+        bomb = with_node.to_dict() if isinstance(with_node, Node) else with_node
+        assert ClassNameNode.is_one(bomb) or ClassTypeNode.is_one(
+            bomb
+        ), f"The replacement of {object_key} must have a module and a class_name or class_type, got {bomb}"
+        if ClassNameNode.is_one(bomb):
+            bomb = dict(bomb, object_key=object_key)
+        parent = self.path_parent(object_key)
+        parent = None if parent is None or parent is self.root else parent
+        dependents = [
+            edge
+            for edge in self.edges_from(object_key)
+            if parent is None or edge.to_key != parent.object_key
+        ]
+
+        for key in self._path_subtree(object_key):
+            self._drop_node(key)
+        if parent is not None:
+            self._record(lambda: parent.assign(old.path, old))
+        self.__from_dict(bomb, old.path, parent)
+
+        new = [
+            n
+            for n in self.path_children(parent if parent is not None else self.root)
+            if n.path == old.path
+        ][-1]
+        for edge in dependents:
+            if edge.to_key in self and not Edge(new, edge.to_key) in self:
+                self.add_edge(new, edge.to_key, edge.path)
+        return new
+
+    def digest(self) -> str:
+        # digest of the whole config: the top level objects and commands by path, with their structural digests
+        content = json.dumps(
+            sorted(
+                (".".join(node.path), self.node_digest(node))
+                for node in self.path_children(self.root)
+            )
+        )
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def diff(self, other: "BombillaDAG") -> dict[str, Any]:
+        # the changes from this config to the other one, as overrides (see utils.overrides): path -> value of the
+        # other config, REMOVE where it has nothing. Nodes with the same digest are skipped without looking into
+        # them, even when the objects they refer to have other keys
+        mine = {".".join(node.path): node for node in self.path_children(self.root)}
+        theirs = {".".join(node.path): node for node in other.path_children(other.root)}
+        changes: dict[str, Any] = {}
+        for path in mine:
+            if path not in theirs:
+                changes[path] = REMOVE
+        for path, node in theirs.items():
+            if path in mine:
+                self.__diff(mine[path], other, node, path, changes)
+            else:
+                changes[path] = BombillaDAG.__plain(node)
+        return changes
 
-    def replace_node(self, node: Node, with_node: Node | str):
-        object_key = node if isinstance(node, str) else node.object_key
-        assert object_key in self, f"No node with {object_key=}"
-        for child in self.children(object_key):
-            self.remove_node(child)
+    def __diff(self, val: Any, other: "BombillaDAG", other_val: Any, path: str, changes: dict[str, Any]):
+        if isinstance(val, Node) and isinstance(other_val, Node):
+            if type(val) is not type(other_val) or BombillaDAG.__head(val) != BombillaDAG.__head(
+                other_val
+            ):
+                changes[path] = BombillaDAG.__plain(other_val)
+            elif self.node_digest(val) != other.node_digest(other_val):
+                if isinstance(val, ReturnNode):
+                    self.__diff(val.execution_cue, other, other_val.execution_cue, path, changes)
+                else:
+                    self.__diff(val.params, other, other_val.params, path + ".params", changes)
+        elif isinstance(val, dict) and isinstance(other_val, dict):
+            for key in val:
+                if key not in other_val:
+                    changes[f"{path}.{key}"] = REMOVE
+            for key, item in other_val.items():
+                if key in val:
+                    self.__diff(val[key], other, item, f"{path}.{key}", changes)
+                else:
+                    changes[f"{path}.{key}"] = BombillaDAG.__plain(item)
+        elif isinstance(val, list) and isinstance(other_val, list) and len(val) == len(other_val):
+            for i, (item, other_item) in enumerate(zip(val, other_val)):
+                self.__diff(item, other, other_item, f"{path}.{i}", changes)
+        elif isinstance(val, (Node, dict, list)) or isinstance(other_val, (Node, dict, list)):
+            changes[path] = BombillaDAG.__plain(other_val)
+        elif type(val) is not type(other_val) or val != other_val:
+            changes[path] = other_val
+
+    @staticmethod
+    def __head(node: Node) -> dict[str, Any]:
+        # what a node is apart from its params (module, class or function...)
+        return {
+            k: v
+            for k, v in node.__dict__.items()
+            if not k.startswith("_") and k not in ("path", "object_key", "execution_cue")
+        }
+
+    @staticmethod
+    def __plain(val: Any) -> Any:
+        if isinstance(val, Node):
+            return val.to_dict()
+        elif isinstance(val, list):
+            return [BombillaDAG.__plain(el) for el in val]
+        elif isinstance(val, dict):
+            return {key: BombillaDAG.__plain(el) for key, el in val.items()}
+        return val
 
     def to_py(self, filename: str | None = None):
         code = []
@@ -297,18 +405,6 @@ class BombillaDAG(DAG):
     def to_json(self):
         return json.dumps(self.to_dict(), indent=4)
 
-    @staticmethod
-    def __get_ref(val: str) -> str | None:
-        # checks by using a regex if the string has a matching pattern like "{hello}"
-        if isinstance(val, str):
-            res = re.match(r"{\w+}", val)
-            if res is None:
-                return None
-            else:
-                span = res.span()
-                return val[span[0] + 1 : span[1] - 1]
-        return None
-
     """
     @staticmethod
     def __is_return(bomb: Any):
@@ -1,6 +1,7 @@
 from .nodes import Node, ValueNode, Edge, MethodCall
-import subprocess
-from typing import Any
+from ..utils.template import references
+from contextlib import contextmanager
+from typing import Any, Callable
 import json
 
 
@@ -9,8 +10,24 @@ class DAG:
         root = Node("__root__", [])
         self.root = root
         self.__nodes: dict[str, Node] = {"__root__": root}
-        self.edges: list[Edge] = []
-        self.path_edges: list[Edge] = []
+        # edges are indexed by their endpoints so that queries don't scan the whole edge list
+        self.__edges: dict[tuple[str, str], Edge] = {}
+        self.__edges_from: dict[str, dict[str, Edge]] = {}
+        self.__edges_to: dict[str, dict[str, Edge]] = {}
+        self.__path_edges: dict[int, Edge] = {}
+        self.__path_edges_from: dict[str, list[Edge]] = {}
+        self.__path_edges_to: dict[str, list[Edge]] = {}
+        self.__order: list[str | None] = ["__root__"]
+        self.__position: dict[str, int] = {"__root__": 0}
+        self.__journal: list[Callable[[], Any]] | None = None
+
+    @property
+    def edges(self) -> list[Edge]:
+        return list(self.__edges.values())
+
+    @property
+    def path_edges(self) -> list[Edge]:
+        return list(self.__path_edges.values())
 
     def plot(self):
         try:
@@ -40,6 +57,8 @@ class DAG:
         else:
             edges = self.edges
         prompt = "\n".join(str(e) for e in edges)
+        import subprocess
+
         command = f"echo '{prompt}' | diagon GraphDAG"
         return subprocess.check_output(command, shell=True).decode("utf-8")
 
@@ -57,7 +76,14 @@ class DAG:
         assert (
             not node in self
         ), f"Node with object_key={node.object_key} already present"
-        self.__nodes[node.object_key] = node
+        object_key = node.object_key
+        self.__nodes[object_key] = node
+        self._record(lambda: self.__nodes.pop(object_key))
+        self.__append_order(object_key)
+        # edges can be inserted before the node they come from (forward references)
+        for edge in list(self.__edges_from.get(object_key, {}).values()):
+            self.__order_edge(edge.from_key, edge.to_key)
+            self.invalidate(edge.to_key)
 
     def add_path_edge(self, from_node: Node | str | None, to_node: Node | str):
         from_node = from_node if from_node is not None else self["__root__"]
@@ -70,7 +96,12 @@ class DAG:
             edge.to_key in self
         ), f"Error inserting edge, no node with object_key={edge.to_key}"
         """
-        self.path_edges.append(edge)
+        self.__link_path(edge)
+        self._record(lambda: self.__unlink_path(edge))
+
+    def remove_path_edge(self, edge: Edge):
+        self.__unlink_path(edge)
+        self._record(lambda: self.__link_path(edge))
 
     def add_edge(self, from_node: Node | str, to_node: Node | str, path: list[str]):
         edge = Edge(from_node, to_node, path)
@@ -83,54 +114,187 @@ class DAG:
             edge.to_key in self
         ), f"Error inserting edge, no node with object_key={edge.to_key}"
         """
-        self.edges.append(edge)
+        self.__link(edge)
+        self._record(lambda: self.__unlink(edge))
+        self.__order_edge(edge.from_key, edge.to_key)
+
+    def remove_edge(self, edge: Edge):
+        self.__unlink(edge)
+        self._record(lambda: self.__link(edge))
+
+    def __link(self, edge: Edge):
+        self.__edges[(edge.from_key, edge.to_key)] = edge
+        self.__edges_from.setdefault(edge.from_key, {})[edge.to_key] = edge
+        self.__edges_to.setdefault(edge.to_key, {})[edge.from_key] = edge
+        self.invalidate(edge.to_key)
+
+    def __unlink(self, edge: Edge):
+        del self.__edges[(edge.from_key, edge.to_key)]
+        del self.__edges_from[edge.from_key][edge.to_key]
+        del self.__edges_to[edge.to_key][edge.from_key]
+        self.invalidate(edge.to_key)
+
+    def __link_path(self, edge: Edge):
+        self.__path_edges[id(edge)] = edge
+        self.__path_edges_from.setdefault(edge.from_key, []).append(edge)
+        self.__path_edges_to.setdefault(edge.to_key, []).append(edge)
+
+    def __unlink_path(self, edge: Edge):
+        del self.__path_edges[id(edge)]
+        self.__path_edges_from[edge.from_key].remove(edge)
+        self.__path_edges_to[edge.to_key].remove(edge)
+
+    # The topological order is maintained while the graph is edited (Pearce-Kelly):
+    # new nodes go last, and an edge that goes backwards only reorders the nodes between its endpoints.
+    # Removed nodes leave a hole in the order, holes are compacted outside of transactions.
+
+    def __append_order(self, object_key: str):
+        self.__position[object_key] = len(self.__order)
+        self.__order.append(object_key)
+
+        def undo():
+            self.__order.pop()
+            del self.__position[object_key]
+
+        self._record(undo)
+
+    def __drop_order(self, object_key: str):
+        position = self.__position.pop(object_key)
+        self.__order[position] = None
+
+        def undo():
+            self.__order[position] = object_key
+            self.__position[object_key] = position
+
+        self._record(undo)
+
+    def __order_edge(self, from_key: str, to_key: str):
+        if from_key not in self.__position or to_key not in self.__position:
+            return
+        lower, upper = self.__position[to_key], self.__position[from_key]
+        if lower > upper:
+            return
+
+        def search(start: str, neighbours: dict, keep) -> list[str]:
+            visited = {start}
+            stack = [start]
+            while stack:
+                for key in neighbours.get(stack.pop(), {}):
+                    if key in self.__position and key not in visited and keep(key):
+                        visited.add(key)
+                        stack.append(key)
+            return list(visited)
+
+        def forward(key: str) -> bool:
+            assert (
+                self.__position[key] != upper
+            ), f"Edge {from_key} -> {to_key} introduces a cycle"
+            return self.__position[key] < upper
+
+        after = search(to_key, self.__edges_from, forward)
+        before = search(from_key, self.__edges_to, lambda k: self.__position[k] > lower)
+        before.sort(key=self.__position.__getitem__)
+        after.sort(key=self.__position.__getitem__)
+        moved = before + after
+        old_positions = {key: self.__position[key] for key in moved}
+        for key, position in zip(moved, sorted(old_positions.values())):
+            self.__position[key] = position
+            self.__order[position] = key
+
+        def undo():
+            for key, position in old_positions.items():
+                self.__position[key] = position
+                self.__order[position] = key
+
+        self._record(undo)
+
+    def __compact_order(self):
+        if self.__journal is not None or len(self.__order) <= 2 * len(self.__position):
+            return
+        self.__order = [key for key in self.__order if key is not None]
+        self.__position = {key: i for i, key in enumerate(self.__order)}
+
+    def _record(self, undo: Callable[[], Any]):
+        # inside a transaction every change to the graph registers how to undo it
+        if self.__journal is not None:
+            self.__journal.append(undo)
+
+    @contextmanager
+    def edit(self):
+        # groups many edits in a transaction, if the block raises every edit is rolled back
+        if self.__journal is not None:
+            yield self
+            return
+        self.__journal = []
+        try:
+            yield self
+        except BaseException:
+            journal, self.__journal = self.__journal, None
+            for undo in reversed(journal):
+                undo()
+            raise
+        finally:
+            self.__journal = None
+        self.__compact_order()
+
+    # Every node caches a digest of its structure (see Node.structure), which covers the digests of the nodes
+    # it depends on. The edges go from a node to the nodes depending on it, so when a node changes the digests
+    # downstream of it are dropped, and computed again only when asked for. A node without a digest has none
+    # downstream of it either, invalidating stops there.
+
+    def node_digest(self, key: str | Node) -> str:
+        node = self[key if isinstance(key, str) else key.object_key]
+        if node._digest is None:
+            node._digest = node.structural_digest(self.__resolve_digest)
+        return node._digest
+
+    def __resolve_digest(self, object_key: str) -> str:
+        # references to keys outside of the graph are known by their name
+        return self.node_digest(object_key) if object_key in self.__nodes else "?" + object_key
+
+    def invalidate(self, key: str | Node):
+        # to be called after a node is edited in place, the graph edits (nodes, edges) already do it
+        object_key = key if isinstance(key, str) else key.object_key
+        stack = [object_key]
+        while stack:
+            node = self.__nodes.get(stack.pop())
+            if node is None or node._digest is None:
+                continue
+            node._digest = None
+            stack.extend(self.__edges_from.get(node.object_key, {}))
 
     def edges_to(self, key: str | Node) -> list[Edge]:
         object_key = key if isinstance(key, str) else key.object_key
         assert object_key in self, f"No node with {object_key=}"
-        return [edge for edge in self.edges if edge.to_key == object_key]
+        return list(self.__edges_to.get(object_key, {}).values())
 
     def edges_from(self, key: str | Node) -> list[Edge]:
         object_key = key if isinstance(key, str) else key.object_key
         assert object_key in self, f"No node with {object_key=}"
-        return [edge for edge in self.edges if edge.from_key == object_key]
+        return list(self.__edges_from.get(object_key, {}).values())
 
     def path_edge_to(self, key: str | Node) -> Edge | None:
         object_key = key if isinstance(key, str) else key.object_key
         assert object_key in self, f"No node with {object_key=}"
-        selected = [edge for edge in self.path_edges if edge.to_key == object_key]
-        return selected[0] if len(selected) > 0 else None
+        selected = self.__path_edges_to.get(object_key)
+        return selected[0] if selected else None
 
     def path_edges_from(self, key: str | Node) -> list[Edge]:
         object_key = key if isinstance(key, str) else key.object_key
         assert object_key in self, f"No node with {object_key=}"
-        return [edge for edge in self.path_edges if edge.from_key == object_key]
+        return list(self.__path_edges_from.get(object_key, []))
 
     def roots(self) -> list[Node]:
-        return [node for node in self.nodes if not self.edges_to(node)]
+        return [node for key, node in self.__nodes.items() if not self.__edges_to.get(key)]
 
     def leaves(self) -> list[Node]:
-        return [node for node in self.nodes if not self.edges_from(node)]
+        return [
+            node for key, node in self.__nodes.items() if not self.__edges_from.get(key)
+        ]
 
     def topological_sort(self) -> list[Node]:
-        roots = self.roots()
-        sorted_nodes: list[Node] = []
-        visited = set()
-
-        def visit(node: Node):
-            if node.object_key in visited:
-                return
-            visited.add(node.object_key)
-            for child in self.children(node):
-                assert isinstance(child, Node)
-                visit(child)
-            sorted_nodes.append(node)
-
-        for root in roots:
-            assert isinstance(root, Node)
-            visit(root)
-        sorted_nodes.reverse()
-        return sorted_nodes
+        self.__compact_order()
+        return [self.__nodes[key] for key in self.__order if key is not None]
 
     def parents(self, key: Node | str) -> list[Node]:
         return [self[e.from_key] for e in self.edges_to(key)]
@@ -145,8 +309,8 @@ class DAG:
 
     def path_sort(self):
         roots = self.path_children(self.root)
-        topological_sort = [n.object_key for n in self.topological_sort()]
-        roots.sort(key=lambda x: topological_sort.index(x.object_key))
+        position = {n.object_key: i for i, n in enumerate(self.topological_sort())}
+        roots.sort(key=lambda x: position[x.object_key])
         roots = [n for n in self.nodes if isinstance(n, ValueNode)] + roots
         return roots
 
@@ -157,19 +321,53 @@ class DAG:
         return [node.object_key for node in self.__nodes.values()]
 
     def remove_node(self, node: Node | str):
+        # removes the node and, recursively, every node that depends on it
         object_key = node if isinstance(node, str) else node.object_key
         assert object_key in self, f"No node with {object_key=}"
-        del self.__nodes[object_key]
-        children = self.children(object_key)
-        self.edges = [edge for edge in self.edges if edge.from_key != object_key]
-        for child in children:
-            self.remove_node(child)
-
-    def replace_node(self, node: Node, with_node: Node | str):
+        stack = [object_key]
+        while stack:
+            key = stack.pop()
+            if key in self.__nodes:
+                stack.extend(self.__edges_from.get(key, {}))
+                self._drop_node(key)
+
+    def replace_node(self, node: Node | str, with_node: Node) -> Node:
+        # with_node takes the place of node in the path tree and for the nodes depending on it,
+        # the nodes nested in node are removed
         object_key = node if isinstance(node, str) else node.object_key
         assert object_key in self, f"No node with {object_key=}"
-        for child in self.children(object_key):
-            self.remove_node(child)
+        path_edge = self.path_edge_to(object_key)
+        dependents = self.edges_from(object_key)
+        for key in self._path_subtree(object_key):
+            self._drop_node(key)
+        self.add_node(with_node)
+        if path_edge is not None:
+            self.add_path_edge(path_edge.from_key, with_node)
+        for edge in dependents:
+            if not Edge(with_node, edge.to_key) in self:
+                self.add_edge(with_node, edge.to_key, edge.path)
+        return with_node
+
+    def _drop_node(self, object_key: str):
+        # removes a single node with its edges, without touching the nodes depending on it
+        for edge in list(self.__edges_from.get(object_key, {}).values()):
+            self.remove_edge(edge)
+        for edge in list(self.__edges_to.get(object_key, {}).values()):
+            self.remove_edge(edge)
+        for edge in self.__path_edges_to.get(object_key, []) + self.__path_edges_from.get(
+            object_key, []
+        ):
+            self.remove_path_edge(edge)
+        node = self.__nodes.pop(object_key)
+        self._record(lambda: self.__nodes.__setitem__(object_key, node))
+        self.__drop_order(object_key)
+
+    def _path_subtree(self, key: Node | str) -> list[str]:
+        object_key = key if isinstance(key, str) else key.object_key
+        subtree = [object_key]
+        for key in subtree:
+            subtree.extend(e.to_key for e in self.__path_edges_from.get(key, []))
+        return subtree
 
     def __getitem__(self, object_key: str) -> Node:
         assert object_key in self, f"No node with {object_key=}"
@@ -177,16 +375,7 @@ class DAG:
 
     def __contains__(self, other: Edge | Node | str):
         if isinstance(other, Edge):
-            return (
-                len(
-                    tuple(
-                        e
-                        for e in self.edges
-                        if e.from_key == other.from_key and e.to_key == other.to_key
-                    )
-                )
-                > 0
-            )
+            return (other.from_key, other.to_key) in self.__edges
         else:
             object_key = other if isinstance(other, str) else other.object_key
             return object_key in self.__nodes
@@ -202,12 +391,6 @@ class DAG:
 
     @staticmethod
     def _get_ref(val: str) -> str | None:
-        # checks by using a regex if the string has a matching pattern like "{hello}"
-        if isinstance(val, str):
-            res = re.match(r"{\w+}", val)
-            if res is None:
-                return None
-            else:
-                span = res.span()
-                return val[span[0] + 1 : span[1] - 1]
-        return None
+        # the first "{hello}" placeholder of the string
+        refs = references(val)
+        return refs[0] if refs else None
@@ -1,11 +1,15 @@
-from typing import Any
+from typing import Any, Callable
 import json
 import random
-import re
-import ipdb
+import hashlib
+from ..utils.debug import set_trace
+from ..utils.template import compile_template
 
 # TODO: merge these nodes with the ones defined in the other file
 class Node:
+    # structural digest, computed and cached by the DAG the node belongs to (see DAG.node_digest)
+    _digest: str | None = None
+
     def __init__(
         self,
         object_key: str,
@@ -48,7 +52,7 @@ class Node:
         for k, v in params.items():
             assert check_type(
                 v
-            ), ipdb.set_trace()  # f"Invalid type {type(v)} for param {k}"
+            ), set_trace()  # f"Invalid type {type(v)} for param {k}"
         self.__params = params
 
     def __setitem__(self, key, value):
@@ -82,7 +86,8 @@ class Node:
                 return {
                     k if not "params" in k else "params": get_bombilla_dict(v)
                     for k, v in obj.__dict__.items()
-                    if k != "path" and not (isinstance(v, str) and v.startswith("_"))
+                    if k not in ("path", "_digest")
+                    and not (isinstance(v, str) and v.startswith("_"))
                 }
 
         result = get_bombilla_dict(self)
@@ -98,6 +103,44 @@ class Node:
     def __eq__(self, other):
         return isinstance(other, Node) and self.to_dict() == other.to_dict()
 
+    def structure(self, resolve: Callable[[str], str]) -> Any:
+        # what the digest covers: the type of the node, its module, class or function, and its params, with the
+        # nested nodes and the references replaced by their digests (resolve gives the digest of an object key).
+        # Object keys are left out, two nodes built the same way from the same inputs have the same digest
+        def canonical(val: Any) -> Any:
+            if isinstance(val, Node):
+                return {"node": resolve(val.object_key)}
+            elif isinstance(val, list):
+                return [canonical(el) for el in val]
+            elif isinstance(val, dict) and "reference_key" in val:
+                return {"node": resolve(val["reference_key"])}
+            elif isinstance(val, dict):
+                return {k: canonical(v) for k, v in val.items()}
+            elif isinstance(val, str):
+                template = compile_template(val)
+                if template is None:
+                    return val
+                if template.is_reference:
+                    return {"node": resolve(template.references[0])}
+                return {
+                    "template": [
+                        segment if i % 2 == 0 else resolve(segment)
+                        for i, segment in enumerate(template.segments)
+                    ]
+                }
+            return val
+
+        fields = {
+            k: {"node": resolve(v)} if k == "reference_key" else canonical(v)
+            for k, v in self.__dict__.items()
+            if not k.startswith("_") and k not in ("path", "object_key")
+        }
+        return [type(self).__name__, fields, canonical(self.params)]
+
+    def structural_digest(self, resolve: Callable[[str], str]) -> str:
+        content = json.dumps(self.structure(resolve), sort_keys=True, default=repr)
+        return hashlib.sha256(content.encode()).hexdigest()
+
     def assign(self, path: list[str], obj: Any):
         relative_path = Node.__relative_path(self.path[-1], path)
         Node.__assign(self, relative_path, obj)
@@ -115,31 +158,35 @@ class Node:
         return path[last_occurrence + 1 :]
 
     @staticmethod
-    def __assign(target: Any, path: list[str], obj: Any):
+    def __assign(target: Any, path: list[str], obj: Any) -> Any:
+        # copy on write: the dicts and lists of the config are copied (once, the copies are _Owned) the first
+        # time something different is written to them, the config the DAG is built from is never modified.
+        # Returns target, or the copy of it that was written to.
         if len(path) == 0:
-            return
-        if isinstance(target, list) or path[0].isdigit():
-            to_set = target
-            current_key = int(path[0])
+            return target
+        current_key = int(path[0]) if isinstance(target, list) or path[0].isdigit() else path[0]
+        if isinstance(target, Node):
             if len(path) == 1:
-                to_set[current_key] = obj
-                return
-            next_obj = to_set[current_key]
-        elif isinstance(target, dict) or isinstance(target, Node):
+                target[current_key] = obj
+            else:
+                current = target[current_key]
+                value = Node.__assign(current, path[1:], obj)
+                if value is not current:
+                    target[current_key] = value
+            return target
+
+        to_set = target if isinstance(target, (dict, list)) else target.__dict__
+        value = obj if len(path) == 1 else Node.__assign(to_set[current_key], path[1:], obj)
+        if type(target) in (dict, list):
+            unchanged = (isinstance(target, list) or current_key in target) and target[
+                current_key
+            ] is value
+            if unchanged:
+                return target
+            target = _OwnedDict(target) if isinstance(target, dict) else _OwnedList(target)
             to_set = target
-            current_key = path[0]
-            if len(path) == 1:
-                to_set[current_key] = obj
-                return
-            next_obj = to_set[current_key]
-        else:
-            to_set = target.__dict__
-            current_key = path[0]
-            if len(path) == 1:
-                to_set[current_key] = obj
-                return
-            next_obj = to_set[current_key]
-        Node.__assign(next_obj, path[1:], obj)
+        to_set[current_key] = value
+        return target
 
     @staticmethod
     def _rand_hex(length: int) -> str:
@@ -151,12 +198,10 @@ class Node:
 
     def _render_val(self, val: Any):
         if isinstance(val, str):
-            match = re.match(r"{\w+}", val)
-            if match is not None:
-                span = match.span()
-                found = val[span[0] + 1 : span[1] - 1]
-                if len(found) == (len(val) - 2):
-                    return found
+            template = compile_template(val)
+            if template is not None:
+                if template.is_reference:
+                    return template.references[0]
                 else:
                     return f'''f"{val}"'''
             return f'"{val}"'
@@ -173,6 +218,15 @@ class Node:
         return ",".join([f"{k}={self._render_val(v)}" for k, v in params.items()])
 
 
+class _OwnedDict(dict):
+    # a dict of the config copied by a node, the node can write to it
+    pass
+
+
+class _OwnedList(list):
+    pass
+
+
 class ClassTypeNode(Node):
     def __init__(
         self,
@@ -212,14 +266,20 @@ class ClassNameNode(Node):
         module: str,
         object_key: str | None = None,
         params: None | dict[str, Any] = None,
+        cache: bool | None = None,
+        shared: bool | None = None,
     ):
         self.class_name = class_name
         self.module = module
+        if cache is not None:
+            self.cache = cache
+        if shared is not None:
+            self.shared = shared
         # puts new_obj_key from PascalCase to snake_case
         object_key = (
             object_key
             if object_key is not None
-            else (f"_{class_name}_{Node._rand_hex(3)}")
+            else (f"_{class_name}_{Node._rand_hex(12)}")
         )
         super().__init__(object_key=object_key, path=path, params=params)
 
@@ -240,6 +300,8 @@ class ClassNameNode(Node):
             module=bomb["module"],
             path=path,
             params=bomb.get("params"),
+            cache=bomb.get("cache"),
+            shared=bomb.get("shared"),
         )
 
 
@@ -251,6 +313,10 @@ class ValueNode(Node):
         self.__fn = "os.environ.get"
         self.__key = self.object_key.upper()
 
+    def structure(self, resolve: Callable[[str], str]) -> Any:
+        # a value given from outside of the config, known only by its key
+        return ["ValueNode", self.object_key]
+
     def to_py(self, at_root: bool = False):
         if at_root:
             return f"{self.object_key}:str = {self.__fn}('{self.__key}')"
@@ -265,10 +331,16 @@ class FunctionCall(Node):
         module: str,
         params: dict[str, Any],
         path: list[str],
+        cache: bool | None = None,
+        shared: bool | None = None,
     ):
         self.function = function
         self.module = module
-        self.object_key = f"_{self.function}_{Node._rand_hex(3)}"
+        if cache is not None:
+            self.cache = cache
+        if shared is not None:
+            self.shared = shared
+        self.object_key = f"_{self.function}_{Node._rand_hex(12)}"
         super().__init__(self.object_key, path, params=params)
 
     @staticmethod
@@ -283,6 +355,8 @@ class FunctionCall(Node):
             module=bomb["module"],
             params=bomb.get("params"),
             path=path,
+            cache=bomb.get("cache"),
+            shared=bomb.get("shared"),
         )
 
     def to_py(self, at_root: bool = False) -> str:
@@ -299,7 +373,7 @@ class MethodCall(Node):
     ):
         self.reference_key = reference_key
         self.function_call = function_call
-        object_key = f"_{reference_key}.{function_call}(..)_{Node._rand_hex(3)}"
+        object_key = f"_{reference_key}.{function_call}(..)_{Node._rand_hex(12)}"
         super().__init__(object_key=object_key, path=path)
         self.params = params if params is not None else {}
 
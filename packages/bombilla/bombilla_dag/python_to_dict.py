@@ -1,5 +1,5 @@
 import ast
-import ipdb
+from ..utils.debug import set_trace
 from .nodes import (
     Node,
     ClassTypeNode,
@@ -108,7 +108,7 @@ def parse_args(
             uba = parse_args(subval, parent, nodes, imports)
             assert isinstance(
                 uba, (str, int, float, bool, Node, list, dict)
-            ), ipdb.set_trace()
+            ), set_trace()
             result[key.value] = uba
     elif isinstance(val, ast.Constant):
         result = val.value
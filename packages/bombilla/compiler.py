@@ -0,0 +1,283 @@
+# Lowers a loaded Bombilla into a flat, ordered list of operations over integer indexed value slots.
+# Running the plan builds the same objects as Bombilla.execute, in the same order, without walking the node tree.
+# With share, the objects and function calls marked "shared": true are built once for every group of them with
+# the same config and the same inputs, the others read the slot of the first one.
+
+from typing import Any, Optional
+
+from .node import (
+    Node,
+    NodeDict,
+    ExperimentNode,
+    Object,
+    FunctionModuleCall,
+    MethodCall,
+    ObjectMethodCall,
+    ObjectReference,
+    ClassTypeAnnotation,
+    load_node,
+)
+from .utils.imports import resolve_module
+from .utils.metadata import generate_metadata, metadata_enabled, flush_metadata
+from .utils.template import Template
+from .utils.checkpoints import fingerprint, nested_object_keys
+
+# every operation is a tuple (opcode, out, a, b)
+LOAD_SYMBOL = 0  # out = import (candidates, symbol) and getattr b, if any
+READ_REF = 1  # out = key_map[a]
+FORMAT = 2  # out = the literal segments a joined with the slots b
+BUILD_LIST = 3  # out = [slots a]
+BUILD_DICT = 4  # out = {key: slot for key, slot in a}
+CONSTRUCT = 5  # out = slot a(**{key: slot for key, slot in b})
+CALL_FUNCTION = 6  # out = slot a(*positional slots, **keyword slots), b = (positional, keywords)
+CALL_METHOD = 7  # out = getattr(slot a, b[0])(**{key: slot for key, slot in b[1]})
+REGISTER = 8  # key_map[a] = slot out, and metadata generated for the descriptor b
+
+OPCODE_NAMES = [
+    "LOAD_SYMBOL",
+    "READ_REF",
+    "FORMAT",
+    "BUILD_LIST",
+    "BUILD_DICT",
+    "CONSTRUCT",
+    "CALL_FUNCTION",
+    "CALL_METHOD",
+    "REGISTER",
+]
+
+
+class ExecutionPlan:
+    def __init__(
+        self,
+        ops: list[tuple],
+        initial: list[Any],
+        results: list[int],
+        shared: Optional[dict[str, int]] = None,
+    ):
+        self.ops = ops
+        # constants already sit in their slots, every other slot starts empty
+        self.initial = initial
+        self.results = results
+        # "module.Class" (or function) -> constructions removed by sharing identical nodes
+        self.shared = shared if shared is not None else {}
+
+    def run(self, key_map: Optional[dict] = None) -> list[Any]:
+        key_map = Node._key_value_map if key_map is None else key_map
+        slots = list(self.initial)
+        try:
+            for opcode, out, a, b in self.ops:
+                if opcode == CONSTRUCT:
+                    slots[out] = slots[a](**{key: slots[s] for key, s in b})
+                elif opcode == READ_REF:
+                    slots[out] = key_map[a]
+                elif opcode == REGISTER:
+                    if a is not None:
+                        key_map[a] = slots[out]
+                    if b is not None and metadata_enabled():
+                        generate_metadata(slots[out], b, Node._root_module)
+                elif opcode == BUILD_DICT:
+                    slots[out] = {key: slots[s] for key, s in a}
+                elif opcode == BUILD_LIST:
+                    slots[out] = [slots[s] for s in a]
+                elif opcode == CALL_METHOD:
+                    method = getattr(slots[a], b[0])
+                    slots[out] = method(**{key: slots[s] for key, s in b[1]})
+                elif opcode == CALL_FUNCTION:
+                    positional, keywords = b
+                    slots[out] = slots[a](
+                        *[slots[s] for s in positional],
+                        **{key: slots[s] for key, s in keywords},
+                    )
+                elif opcode == FORMAT:
+                    slots[out] = "".join(
+                        segment if i % 2 == 0 else str(slots[b[i // 2]])
+                        for i, segment in enumerate(a)
+                    )
+                elif opcode == LOAD_SYMBOL:
+                    symbol = resolve_module(*a)
+                    slots[out] = getattr(symbol, b) if b is not None else symbol
+        finally:
+            flush_metadata()
+        return [slots[s] for s in self.results]
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __str__(self):
+        lines = []
+        for opcode, out, a, b in self.ops:
+            lines.append(f"{OPCODE_NAMES[opcode]:<14} {out:>5} {a!r} {b!r}")
+        return "\n".join(lines)
+
+
+class Compiler:
+    def __init__(self, share: bool = False):
+        self.ops: list[tuple] = []
+        self.initial: list[Any] = []
+        # object key -> slot of the object, for the objects registered earlier in the plan
+        self.key_slots: dict[str, int] = {}
+        self.symbol_slots: dict[tuple, int] = {}
+        self.share = share
+        # fingerprint -> slot of the first shared node with it
+        self.shared_slots: dict[str, int] = {}
+        self.shared: dict[str, int] = {}
+
+    def compile(self, root_node: ExperimentNode, command: Optional[str] = None) -> ExecutionPlan:
+        # mirrors ExperimentNode.__call__ and execute_experiment
+        self.compile_kwargs(root_node._objects_node)
+        results = []
+        if command is not None:
+            assert command in root_node.experiment, f"{command} not in returns"
+            dic = root_node.experiment[command]
+            for item in dic if type(dic) == list else [dic]:
+                node = load_node(item)
+                node.__load__()
+                results.append(self.compile_value(node))
+        return ExecutionPlan(self.ops, self.initial, results, self.shared)
+
+    def slot(self) -> int:
+        self.initial.append(None)
+        return len(self.initial) - 1
+
+    def emit(self, opcode: int, a: Any = None, b: Any = None, out: Optional[int] = None) -> int:
+        out = self.slot() if out is None else out
+        self.ops.append((opcode, out, a, b))
+        return out
+
+    def constant(self, value: Any) -> int:
+        out = self.slot()
+        self.initial[out] = value
+        return out
+
+    def reference(self, key: str) -> int:
+        if key in self.key_slots:
+            return self.key_slots[key]
+        return self.emit(READ_REF, key)
+
+    def symbol(self, node: Node, attribute: Optional[str]) -> int:
+        spec = node.module_spec()
+        if (spec, attribute) not in self.symbol_slots:
+            self.symbol_slots[(spec, attribute)] = self.emit(LOAD_SYMBOL, spec, attribute)
+        return self.symbol_slots[(spec, attribute)]
+
+    def template(self, template: Template) -> int:
+        if template.is_reference:
+            return self.reference(template.references[0])
+        return self.emit(
+            FORMAT, template.segments, [self.reference(key) for key in template.references]
+        )
+
+    def compile_kwargs(self, node: Node) -> list[tuple[str, int]]:
+        # like NodeDict.__call__: placeholders are resolved first, then the values are built in order
+        resolved = {}
+        for key, template in node._templates.items():
+            if type(template) == list:
+                resolved[key] = [self.template(t) if t is not None else None for t in template]
+            else:
+                resolved[key] = self.template(template)
+
+        kwargs = []
+        for key, value in node.__dict__.items():
+            if key.startswith("_") or key not in node._original_keys:
+                continue
+            if key in resolved and type(resolved[key]) == list:
+                slots = [
+                    s if s is not None else self.compile_value(item)
+                    for s, item in zip(resolved[key], value)
+                ]
+                kwargs.append((key, self.emit(BUILD_LIST, slots)))
+            elif key in resolved:
+                kwargs.append((key, resolved[key]))
+            else:
+                kwargs.append((key, self.compile_value(value)))
+        return kwargs
+
+    def compile_value(self, value: Any) -> int:
+        if isinstance(value, Node):
+            return self.compile_node(value)
+        elif isinstance(value, list):
+            return self.emit(BUILD_LIST, [self.compile_value(item) for item in value])
+        return self.constant(value)
+
+    def compile_node(self, node: Node) -> int:
+        # a shared node that nests keyed objects is built on its own, reusing another node's object would leave
+        # its nested keys unregistered
+        if (
+            self.share
+            and node.__dict__.get("shared")
+            and isinstance(node, (Object, FunctionModuleCall))
+            and not nested_object_keys(node._original_args)
+        ):
+            return self.compile_shared(node)
+        return self.compile_new(node)
+
+    def compile_shared(self, node: Node) -> int:
+        # references are identified by the slot they read, so equal fingerprints mean equal inputs
+        key = fingerprint(
+            node._original_args,
+            lambda ref: f"slot:{self.key_slots[ref]}" if ref in self.key_slots else f"ref:{ref}",
+        )
+        if key not in self.shared_slots:
+            self.shared_slots[key] = self.compile_new(node)
+            return self.shared_slots[key]
+
+        out = self.shared_slots[key]
+        name = ".".join(
+            node._original_args[k]
+            for k in ("module", "class_name", "function")
+            if k in node._original_args
+        )
+        self.shared[name] = self.shared.get(name, 0) + 1
+        if "object_key" in node._original_keys:
+            self.emit(REGISTER, node.object_key, None, out=out)
+            self.key_slots[node.object_key] = out
+        return out
+
+    def compile_new(self, node: Node) -> int:
+        if isinstance(node, Object):
+            callable_slot = self.symbol(
+                node, node.class_name if "class_name" in node.__dict__ else None
+            )
+            out = self.emit(CONSTRUCT, callable_slot, self.compile_kwargs(node.param_node))
+            return self.register(node, out)
+        elif isinstance(node, FunctionModuleCall):
+            kwargs = self.compile_kwargs(node._param_node)
+            positional = [s for key, s in kwargs if key == ""]
+            keywords = [(key, s) for key, s in kwargs if key != ""]
+            function_slot = self.symbol(node, node.function)
+            out = self.emit(CALL_FUNCTION, function_slot, (positional, keywords))
+            return self.register(node, out)
+        elif isinstance(node, MethodCall):
+            kwargs = self.compile_kwargs(node.param_node)
+            out = self.emit(
+                CALL_METHOD, self.reference(node.reference_key), (node.function_call, kwargs)
+            )
+            return self.register(node, out)
+        elif isinstance(node, ObjectReference):
+            return self.reference(node.reference_key)
+        elif isinstance(node, ClassTypeAnnotation):
+            return self.symbol(node, node.class_type)
+        elif isinstance(node, ObjectMethodCall):
+            return self.emit(BUILD_DICT, self.compile_kwargs(node._node))
+        elif isinstance(node, NodeDict):
+            return self.emit(BUILD_DICT, self.compile_kwargs(node))
+        raise TypeError(f"Can't compile node of type {type(node).__name__}")
+
+    def register(self, node: Node, out: int) -> int:
+        # like Node.post_object_creation
+        key = node.object_key if "object_key" in node._original_keys else None
+        descriptor = {
+            key: node._original_args[key]
+            for key in ("module", "function", "class_name")
+            if key in node._original_args
+        }
+        self.emit(REGISTER, key, descriptor or None, out=out)
+        if key is not None:
+            self.key_slots[key] = out
+        return out
+
+
+def compile_plan(
+    root_node: ExperimentNode, command: Optional[str] = None, share: bool = False
+) -> ExecutionPlan:
+    return Compiler(share).compile(root_node, command)
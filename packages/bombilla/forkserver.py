@@ -0,0 +1,158 @@
+# Runs the variants of a sweep in forked children. The objects no variant changes (nor depends on a changed
+# object, following the BombillaDAG edges) are built once in the parent; every child inherits them through
+# copy-on-write memory, builds the objects its overrides affect and runs the experiment command.
+
+import os
+import sys
+import time
+import pickle
+import selectors
+import traceback
+from typing import Any, Optional, Sequence
+
+from .bombilla import Bombilla
+from .batch import picklable
+from .node import Node
+from .scheduler import build_objects, object_dependencies, object_dependents
+from .sweep import Variant
+from .utils.metadata import flush_metadata
+from .utils.overrides import split_path
+
+
+def changed_objects(
+    variants: Sequence[Variant], dependencies: dict[str, set[str]]
+) -> dict[str, set[str]]:
+    # variant id -> top level objects it overrides, and the objects that depend on them
+    changed = {}
+    for variant in variants:
+        keys = {
+            split_path(path)[1]
+            for path in variant.overrides
+            if split_path(path)[0] == "objects" and split_path(path)[1] in dependencies
+        }
+        changed[variant.id] = set(object_dependents(dependencies, keys))
+    return changed
+
+
+def run_forked(
+    variants: Sequence[Variant],
+    command: str = "train",
+    max_workers: Optional[int] = None,
+) -> list[dict[str, Any]]:
+    # one result per variant (as batch.run_job), in the order of the variants
+    assert hasattr(os, "fork"), "run_forked needs os.fork"
+    variants = list(variants)
+    if not variants:
+        return []
+    sweep = variants[0].sweep
+    assert all(
+        variant.sweep.config is sweep.config for variant in variants
+    ), "All the variants must come from the same base config"
+
+    base = Bombilla(sweep.config, sweep.root_module, {})
+    base.load()
+    object_keys = [key for key in base.root_node._objects_node._original_keys]
+    dependencies = object_dependencies(base.dag, object_keys)
+    changed = changed_objects(variants, dependencies)
+    unchanged = set(object_keys) - set().union(*changed.values())
+    build_objects(base.root_node, unchanged)
+    flush_metadata()
+
+    shared_objects = dict(Node._key_value_map)
+    shared_nodes = dict(Node._key_nodes)
+
+    results: list[Optional[dict[str, Any]]] = [None] * len(variants)
+    selector = selectors.DefaultSelector()
+    running: dict[int, tuple[int, int, bytearray]] = {}  # fd -> (variant position, pid, output)
+    max_workers = max_workers or os.cpu_count() or 1
+    pending = iter(enumerate(variants))
+
+    def start(position: int, variant: Variant):
+        read_fd, write_fd = os.pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            # whatever happens, the child never returns into the loop of the parent
+            status = 1
+            try:
+                os.close(read_fd)
+                result = run_variant(
+                    variant, command, changed[variant.id], shared_objects, shared_nodes
+                )
+                with os.fdopen(write_fd, "wb") as f:
+                    f.write(pickle.dumps(result))
+                status = 0
+            finally:
+                os._exit(status)
+        os.close(write_fd)
+        os.set_blocking(read_fd, False)
+        running[read_fd] = (position, pid, bytearray())
+        selector.register(read_fd, selectors.EVENT_READ)
+
+    try:
+        for position, variant in pending:
+            start(position, variant)
+            if len(running) >= max_workers:
+                break
+        while running:
+            for key, _ in selector.select():
+                fd = key.fd
+                position, pid, output = running[fd]
+                chunk = os.read(fd, 1 << 16)
+                if chunk:
+                    output.extend(chunk)
+                    continue
+                selector.unregister(fd)
+                os.close(fd)
+                del running[fd]
+                _, status = os.waitpid(pid, 0)
+                if output:
+                    results[position] = pickle.loads(bytes(output))
+                else:
+                    results[position] = {
+                        "variant": variants[position].id,
+                        "index": variants[position].index,
+                        "pid": pid,
+                        "status": 1,
+                        "error": f"child exited with status {os.waitstatus_to_exitcode(status)}",
+                    }
+                for next_position, variant in pending:
+                    start(next_position, variant)
+                    break
+    finally:
+        selector.close()
+
+    return results
+
+
+def run_variant(
+    variant: Variant,
+    command: str,
+    changed: set[str],
+    shared_objects: dict[str, Any],
+    shared_nodes: dict[str, Any],
+) -> dict[str, Any]:
+    # runs in the child: only the changed objects are built, the others are the parent's
+    start = time.perf_counter()
+    result: dict[str, Any] = {
+        "variant": variant.id,
+        "index": variant.index,
+        "overrides": picklable(variant.overrides),
+        "pid": os.getpid(),
+    }
+    try:
+        bombilla = variant.bombilla(dict(shared_objects))
+        Node._key_nodes.update(shared_nodes)
+        bombilla.load()
+        build_objects(bombilla.root_node, changed)
+        returns = bombilla.root_node.execute_experiment(command)._results
+        result["status"] = 0
+        result["returns"] = [picklable(value) for value in returns]
+    except BaseException as err:
+        result["status"] = 1
+        result["error"] = "".join(traceback.format_exception(err))
+    finally:
+        flush_metadata()
+    result["wall_time"] = time.perf_counter() - start
+    return result
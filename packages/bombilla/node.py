@@ -1,34 +1,89 @@
-from distutils import errors
-from re import S
 from typing import Optional, Any, Callable, Type, Union
+from types import MappingProxyType
 import json
-
-import toml
-from .utils.metadata import generate_metadata
+import sys
+import warnings
+
+from .utils.metadata import generate_metadata, metadata_enabled
+from .utils.imports import resolve_module, module_candidates
+from .utils.template import compile_template
+from .utils.checkpoints import (
+    fingerprint,
+    nested_object_keys,
+    value_fingerprint,
+    load_checkpoint,
+    store_checkpoint,
+)
 
 from . import utils
-import regex as re
 
-import ipdb
 
 SimpleType = Union[str, int, float, bool, None]
 
+# shared by the nodes without placeholders, never written to
+_EMPTY = MappingProxyType({})
+
+# values repeated across many nodes, a single copy of each is kept
+INTERNED_KEYS = (
+    "module",
+    "class_name",
+    "class_type",
+    "function",
+    "function_call",
+    "reference_key",
+    "object_key",
+)
+
 
 class Node:
+    # the bookkeeping of every node has a fixed layout, the keys of the config are attributes in __dict__
+    __slots__ = (
+        "_original_args",
+        "_parent",
+        "_templates",
+        "_uno_key_value_map",
+        "__dict__",
+        "__weakref__",
+    )
+
     object_key: Optional[str] = None
     _py_object: Optional[object] = None
     _docs: Optional[str] = None
+    _fingerprint: Optional[str] = None
 
     def __init__(self, args, parent=None, **kawrgs) -> None:
-        self._original_keys = args.keys()
-        self._original_args = dict(args)
-        self._uno_key_value_map = {}
+        # the config dict itself, nodes don't modify it
+        self._original_args = args
+        self._uno_key_value_map = _EMPTY
         self._parent = parent
+        self._templates = _EMPTY
 
         if args is None:
             args = self._json()
+        templates = {}
         for key, val in args.items():
+            if type(val) == str:
+                if key in INTERNED_KEYS:
+                    val = sys.intern(val)
+                template = compile_template(val)
+                if template is not None:
+                    templates[key] = template
+            elif type(val) == list:
+                item_templates = [
+                    compile_template(item) if type(item) == str else None
+                    for item in val
+                ]
+                if any(item_templates):
+                    templates[key] = item_templates
+                    # resolved in place later, the list of the config is left as it was
+                    val = list(val)
             setattr(self, key, val)
+        if templates:
+            self._templates = templates
+
+    @property
+    def _original_keys(self):
+        return self._original_args.keys()
 
     def _get_python_object(self) -> object:
         pass
@@ -40,53 +95,62 @@ class Node:
     def set_config(root_module: str, key_value_map: dict):
         Node._root_module = root_module
         Node._key_value_map = key_value_map
+        # object key -> node that built the object, for the fingerprints of the cached nodes
+        Node._key_nodes = {}
 
     def load_dynamic_objects(self):
-        for key, value in self.__dict__.items():
-            if (
-                type(value) == str
-                and key in self._original_keys
-                and re.search(r"{.*}", value)
-            ):
-                # get the key name
-                key_name = re.search(r"{.*}", value).group(0)[1:-1]
-
-                dynamic_object = Node._key_value_map[key_name]
-                self._uno_key_value_map[key] = value
-
-                setattr(self, key, dynamic_object)
-
-            if type(value) == list:
-                set = False
-                for i, item in enumerate(value):
-                    if (
-                        type(item) == str
-                        and key in self._original_keys
-                        and re.search(r"{.*}", item)
-                    ):
-                        # get the key name
-                        key_name = re.search(r"{.*}", item).group(0)[1:-1]
-
-                        dynamic_object = Node._key_value_map[key_name]
-                        value[i] = dynamic_object
-                        set = True
-
-                if set:
-
-                    self._uno_key_value_map[key] = value
-                    setattr(self, key, value)
+        # placeholders were compiled when the node was created, only those strings are resolved
+        if self._templates and self._uno_key_value_map is _EMPTY:
+            self._uno_key_value_map = {}
+        for key, template in self._templates.items():
+            value = getattr(self, key)
+            if key not in self._uno_key_value_map:
+                self._uno_key_value_map[key] = (
+                    list(value) if type(value) == list else value
+                )
+            if type(template) == list:
+                for i, item in enumerate(template):
+                    if item is not None:
+                        value[i] = item.resolve(Node._key_value_map)
+            else:
+                setattr(self, key, template.resolve(Node._key_value_map))
 
     def post_object_creation(self):
         if "object_key" in self._original_keys:
             Node._key_value_map[self.object_key] = self._py_object
+            Node._key_nodes[self.object_key] = self
 
-        self.generate_metadata(self._py_object, self.to_dict())
+        if metadata_enabled():
+            # only what identifies the export in metadata.json, the full to_dict is not needed
+            self.generate_metadata(
+                self._py_object,
+                {
+                    key: self._original_args[key]
+                    for key in ("module", "function", "class_name")
+                    if key in self._original_args
+                },
+            )
+
+    def fingerprint(self) -> Optional[str]:
+        # hash of the config of the node and of the objects it refers to (see utils/checkpoints.py)
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint(self._original_args, Node.key_fingerprint)
+        return self._fingerprint
+
+    @staticmethod
+    def key_fingerprint(key: str) -> Optional[str]:
+        if key in Node._key_nodes:
+            return Node._key_nodes[key].fingerprint()
+        if key in Node._key_value_map:
+            return value_fingerprint(Node._key_value_map[key])
+        return None
 
     def generate_metadata(self, obj, metadata):
 
         generate_metadata(obj, metadata, Node._root_module)
 
-    def load_module(self):
+    def module_spec(self) -> tuple[tuple[str, ...], Optional[str]]:
+        # the candidate module names and the symbol imported from them
         assert "module" in self.__dict__, "module not found"
 
         fromlist = [self.class_name] if hasattr(self, "class_name") else []
@@ -98,33 +162,13 @@ class Node:
         if hasattr(self, "class_type"):
             fromlist = [self.class_type]
 
-        module_list = [
-            self.module,
-        ]
-        if (
-            hasattr(Node, "_root_module")
-            and Node._root_module != None
-            and self._root_module != ""
-        ):
-            module_list.append(Node._root_module + "." + self.module)
-        module = None
-        for module_name in module_list:
-            # print(f"Trying to import {module_name}")
-            try:
-                module = __import__(module_name, fromlist=fromlist)
-                break
-            except ModuleNotFoundError as err:
-                # print(f"{err.name=} {err.path=} {err.msg=}")
-                # print(f"{module_name=}")
-                if (
-                    err.name != None
-                    and err.name.split(".")[0] != module_name.split(".")[0]
-                ):
-                    raise err
-                pass
-
-        if module == None:
-            raise ModuleNotFoundError(f'Module "{self.module}" not found')
+        root_module = Node._root_module if hasattr(Node, "_root_module") else None
+        return module_candidates(self.module, root_module), (
+            fromlist[0] if fromlist else None
+        )
+
+    def load_module(self):
+        module = resolve_module(*self.module_spec())
 
         if "class_name" in self.__dict__:
             module = getattr(module, self.class_name)
@@ -191,20 +235,20 @@ class Node:
                 }
         return cur_params
 
+    @classmethod
+    def signature(cls: Type) -> frozenset[str]:
+        # the keys a dict must have to be a node of this type (the properties without a None default),
+        # computed once per class
+        if "_signature" not in cls.__dict__:
+            cls._signature = frozenset(
+                key for key, val in cls._base_json().items() if val is not None
+            )
+        return cls._signature
+
     @classmethod
     def is_one(cls: Type, obj: Any) -> bool:
         # checks that the given object has the same property as the current node
-        """
-        return isinstance(obj, dict) and (
-            sorted(list(obj.keys())) == node_properties
-        )
-        """
-        if not isinstance(obj, dict):
-            return False
-        for key, val in cls._base_json().items():
-            if key not in obj and val is not None:
-                return False
-        return True
+        return isinstance(obj, dict) and cls.signature() <= obj.keys()
 
     @classmethod
     def assert_is_one(cls: Type, obj: Any):
@@ -233,6 +277,8 @@ class Node:
             return super_dict
 
     def to_toml(self):
+        import toml
+
         t = toml.dumps(self.to_dict())
         return t
 
@@ -265,15 +311,14 @@ class NodeDict(Node):
                     self._node_key_dict[key] = val
 
                 elif isinstance(val, list):
-                    nodes = []
-                    for i, item in enumerate(val):
-                        item = load_node(item, parent=self)
-                        if isinstance(item, Node):
-                            item.__load__(parent=self)
-                            nodes.append(item)
-                            val[i] = item
-                            self._node_key_dict[key] = nodes
-                    setattr(self, key, val)
+                    # a new list, the list of the config keeps its dicts
+                    items = [load_node(item, parent=self) for item in val]
+                    nodes = [item for item in items if isinstance(item, Node)]
+                    for item in nodes:
+                        item.__load__(parent=self)
+                    if nodes:
+                        self._node_key_dict[key] = nodes
+                    setattr(self, key, items)
 
         self._loaded = True
         # ipdb.set_trace()
@@ -284,16 +329,8 @@ class NodeDict(Node):
 
         self.load_dynamic_objects()
 
-        def val_to_call(val, parent: Node | None = None):
-            if isinstance(val, Node):
-                return val()  # if not isinstance(parent, ExperimentNode) else val
-            elif isinstance(val, list):
-                return [val_to_call(item) for item in val]
-            else:
-                return val
-
         result = {
-            key: val_to_call(val)
+            key: call_value(val)
             for key, val in self.__dict__.items()
             if not key.startswith("_") and key in self._original_keys
         }
@@ -409,6 +446,15 @@ class NodeDict(Node):
         return params, errors
 
 
+def call_value(val):
+    if isinstance(val, Node):
+        return val()
+    elif isinstance(val, list):
+        return [call_value(item) for item in val]
+    else:
+        return val
+
+
 class ObjectReference(Node):
     reference_key: str = ""
     _reference: Optional[Node] = None
@@ -538,6 +584,35 @@ class MethodArgNode(Node):
 
         return method(*args, **p, **kwargs)
 
+    def build_cached(self, build: Callable[[], Any]) -> Any:
+        # with "cache": true the object is loaded from the checkpoint cache when an identical node was built before
+        key = self.fingerprint() if self.__dict__.get("cache") and self.cacheable() else None
+        if key is not None:
+            found, obj = load_checkpoint(key)
+            if found:
+                return obj
+        obj = build()
+        if key is not None:
+            store_checkpoint(
+                key,
+                obj,
+                {
+                    k: self._original_args[k]
+                    for k in ("object_key", "module", "class_name", "function")
+                    if k in self._original_args
+                },
+            )
+        return obj
+
+    def cacheable(self) -> bool:
+        # a cache hit skips building the params, objects nested with their own object_key would never be built
+        nested = nested_object_keys(self._original_args)
+        if nested:
+            warnings.warn(
+                f"Not caching {self.object_key}, it nests the objects {nested} that others can refer to"
+            )
+        return not nested
+
     def has_method(self, method_name: str):
         method_arg_names = [arg["function"] for arg in self.method_args]
         return method_name in method_arg_names
@@ -661,17 +736,19 @@ class FunctionModuleCall(MethodArgNode):
         return params, errors
 
     def __call__(self):
-        params = self._param_node()
+        def build():
+            params = self._param_node()
 
-        module = self.load_module()
-        function = getattr(module, self.function)
+            module = self.load_module()
+            function = getattr(module, self.function)
 
-        _arg, _kwarg = flatten_nameless_params(params)
+            _arg, _kwarg = flatten_nameless_params(params)
 
-        if _arg:
-            self._py_object = function(*_arg, **_kwarg)
-        else:
-            self._py_object = function(**params)
+            if _arg:
+                return function(*_arg, **_kwarg)
+            return function(**params)
+
+        self._py_object = self.build_cached(build)
         self.post_object_creation()
         return self._py_object
 
@@ -716,7 +793,7 @@ class Object(MethodArgNode):
             return self._py_object
 
         module = self.load_module()
-        self._py_object = module(**self.param_node())
+        self._py_object = self.build_cached(lambda: module(**self.param_node()))
         self.post_object_creation()
         return self._py_object
 
@@ -854,12 +931,14 @@ class ExperimentNode(Node):
             [load_node(item) for item in dic] if type(dic) == list else [load_node(dic)]
         )
 
-        for node in nodes:
-            node.__load__()
-            node.__call__()
+        self._results = [self.execute_step(node) for node in nodes]
 
         return self
 
+    def execute_step(self, node: Node) -> Any:
+        node.__load__()
+        return node.__call__()
+
 
 node_types: list[Type] = [
     Object,
@@ -883,12 +962,35 @@ SyntaxNode = Union[
 ]
 
 
+# key set of a dict -> the first of node_types whose signature it has, filled as dicts are classified
+_node_type_cache: dict[frozenset[str], Optional[Type]] = {}
+
+
+def register_node_type(node_type: Type, before: Optional[Type] = NodeDict):
+    # node types defined outside of bombilla, tried before `before` (NodeDict, that matches any dict, by default)
+    assert issubclass(node_type, Node), f"{node_type} is not a Node"
+    if node_type in node_types:
+        node_types.remove(node_type)
+    index = node_types.index(before) if before in node_types else len(node_types)
+    node_types.insert(index, node_type)
+    _node_type_cache.clear()
+
+
+def node_type_of(args: dict) -> Optional[Type]:
+    keys = frozenset(args)
+    if keys in _node_type_cache:
+        return _node_type_cache[keys]
+    node_type = next(
+        (node_type for node_type in node_types if node_type.signature() <= keys), None
+    )
+    _node_type_cache[keys] = node_type
+    return node_type
+
+
 def load_node(args, parent=None):
     if isinstance(args, dict):
-        node: Optional[SyntaxNode] = None
-        for node_type in node_types:
-            if node_type.is_one(args):
-                node = node_type(args, parent=parent)
-                return node
+        node_type = node_type_of(args)
+        if node_type is not None:
+            return node_type(args, parent=parent)
 
     return args
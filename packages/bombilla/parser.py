@@ -2,11 +2,11 @@
 
 
 from argparse import Namespace
-import re
 from typing import Callable
 from .utils import utils
+from .utils.imports import resolve_module
+from .utils.template import compile_template
 from .utils.bunch import Bunch
-import ipdb
 
 
 def parse_py_module_to_dict(
@@ -22,7 +22,8 @@ def parse_py_module_to_dict(
     merged_params, error = utils.get_function_parameters(
         object, definition, generate_defauls
     )
-    definition["params"] = merged_params.copy()
+    # a new definition, the given one is left untouched
+    definition = dict(definition, params=merged_params)
 
     return definition, error
 
@@ -83,20 +84,16 @@ def load_module(object: Bunch, base_module: str, root_module: str):
 
     assert "module" in object
     assert "class" or "function" in object
-    fromlist = [object["class"]] if "class" in object else [object["function"]]
+    symbol = object["class"] if "class" in object else object["function"]
+    candidates = (
+        base_module + "." + object["module"],
+        root_module + "." + object["module"],
+        object["module"],
+    )
     try:
-        module = __import__(base_module + "." + object["module"], fromlist=fromlist)
+        module = resolve_module(candidates, symbol)
     except ModuleNotFoundError:
-        # now try shared imports
-        try:
-            module = __import__(root_module + "." + object["module"], fromlist=fromlist)
-        except ModuleNotFoundError:
-
-            # lastly try global imports
-            try:
-                module = __import__(object["module"], fromlist=fromlist)
-            except ModuleNotFoundError:
-                return object
+        return object
 
     if "class" in object:
         module = getattr(module, object["class"])
@@ -190,15 +187,11 @@ def __generate_children(
 
     params.update(new_params)
 
-    # replace {regex} with values from map_key_values
+    # replace {placeholders} with values from map_key_values
     for key, value in params.items():
-
-        # regex for {anystring}
-        if type(value) == str and re.search(r"{.*}", value):
-            # get the key name
-            key_name = re.search(r"{.*}", value).group(0)[1:-1]
-            # replace the value
-            params[key] = value.replace("{" + key_name + "}", map_key_values[key_name])
+        template = compile_template(value) if type(value) == str else None
+        if template is not None:
+            params[key] = template.resolve(map_key_values)
 
     return params
 
@@ -264,6 +257,8 @@ def generate_params_recursively(
     errors = [error] if error else []
 
     if "params" in object:
+        # only the params and lists that get generated definitions are copied, the rest is shared with object
+        params = object["params"]
         for key, value in object["params"].items():
             if type(value) == dict and (
                 "module" and ("class" or "function") in value.keys()
@@ -272,11 +267,14 @@ def generate_params_recursively(
                 obj_def, error = generate_params_recursively(
                     value, base_module, root_module, generate_default_params
                 )
-                object["params"][key] = obj_def.copy()
+                if params is object["params"]:
+                    params = dict(params)
+                params[key] = obj_def
                 errors += [error] if error else []
 
             if type(value) == list:
 
+                items = value
                 for index, item in enumerate(value):
                     if type(item) == dict and (
                         "module" and ("class" or "function") in item.keys()
@@ -285,8 +283,17 @@ def generate_params_recursively(
                         obj_def, error = generate_params_recursively(
                             item, base_module, root_module, generate_default_params
                         )
-                        object["params"][key][index] = obj_def.copy()
+                        if items is value:
+                            items = list(value)
+                        items[index] = obj_def
                         errors += [error] if error else []
+                if items is not value:
+                    if params is object["params"]:
+                        params = dict(params)
+                    params[key] = items
+
+        if params is not object["params"]:
+            object = dict(object, params=params)
 
     return object, errors
 
@@ -316,7 +323,7 @@ def generate_params(
             gen_def, err = generate_params_recursively(
                 root[key], base_module, root_module, generate_defauls
             )
-            root[key] = gen_def.copy()
+            root[key] = gen_def
 
             errors += err
 
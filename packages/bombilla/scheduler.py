@@ -0,0 +1,128 @@
+# Builds the objects of an experiment on a thread pool, following the dependency edges of the BombillaDAG
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+from typing import TYPE_CHECKING, Any, Optional
+
+from .node import ExperimentNode, call_value
+
+if TYPE_CHECKING:
+    from .bombilla_dag.bombilla_dag import BombillaDAG
+
+
+def object_owners(dag: "BombillaDAG", object_keys: list[str]) -> dict[str, str]:
+    # every node of the dag belongs to the top level object it is defined in (its path is ["objects", key, ...])
+    from .bombilla_dag.nodes import ValueNode
+
+    owners = {key: key for key in object_keys}
+    for node in dag.nodes:
+        if isinstance(node, ValueNode):
+            continue
+        if len(node.path) >= 2 and node.path[0] == "objects" and node.path[1] in owners:
+            owners[node.object_key] = node.path[1]
+    return owners
+
+
+def object_dependencies(dag: "BombillaDAG", object_keys: list[str]) -> dict[str, set[str]]:
+    owners = object_owners(dag, object_keys)
+    dependencies: dict[str, set[str]] = {key: set() for key in object_keys}
+    for edge in dag.edges:
+        from_owner = owners.get(edge.from_key)
+        to_owner = owners.get(edge.to_key)
+        if from_owner is None or to_owner is None or from_owner == to_owner:
+            continue
+        dependencies[to_owner].add(from_owner)
+
+    return dependencies
+
+
+def object_dependents(
+    dependencies: dict[str, set[str]], keys: set[str]
+) -> dict[str, Optional[str]]:
+    # the keys and every object that depends on one of them, each with the object it was reached from
+    # (None for the keys themselves)
+    dependents: dict[str, list[str]] = {key: [] for key in dependencies}
+    for key, deps in dependencies.items():
+        for dep in deps:
+            dependents[dep].append(key)
+
+    reached: dict[str, Optional[str]] = {key: None for key in keys}
+    stack = list(keys)
+    while stack:
+        key = stack.pop()
+        for dependent in dependents.get(key, []):
+            if dependent not in reached:
+                reached[dependent] = key
+                stack.append(dependent)
+    return reached
+
+
+def build_objects(root_node: ExperimentNode, keys: set[str]):
+    # builds only the given top level objects, in the order of the config like ExperimentNode.__call__
+    root_node.load_dynamic_objects()
+    objects_node = root_node._objects_node
+    objects_node.load_dynamic_objects()
+    for key in objects_node._original_keys:
+        if key in keys:
+            call_value(getattr(objects_node, key))
+
+
+def execute_objects(
+    root_node: ExperimentNode,
+    dag: "BombillaDAG",
+    max_workers: Optional[int] = None,
+    built: Optional[dict[str, Any]] = None,
+) -> dict[str, Any]:
+    # builds every top level object as soon as the objects it refers to are built,
+    # on the first failure the pending objects are cancelled and the error is raised.
+    # The objects in built (key -> object) are taken as they are
+    root_node.load_dynamic_objects()
+    objects_node = root_node._objects_node
+    objects_node.load_dynamic_objects()
+
+    object_keys = [key for key in objects_node._original_keys if not key.startswith("_")]
+    dependencies = object_dependencies(dag, object_keys)
+    dependents: dict[str, list[str]] = {key: [] for key in object_keys}
+    for key, deps in dependencies.items():
+        for dep in deps:
+            dependents[dep].append(key)
+    built = {key: value for key, value in (built or {}).items() if key in dependencies}
+    waiting = {
+        key: len(deps - built.keys())
+        for key, deps in dependencies.items()
+        if key not in built
+    }
+
+    results: dict[str, Any] = dict(built)
+    running = {}
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bombilla")
+
+    def submit(key: str):
+        running[pool.submit(call_value, getattr(objects_node, key))] = key
+
+    try:
+        for key in object_keys:
+            if waiting.get(key) == 0:
+                submit(key)
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_EXCEPTION)
+            for future in done:
+                key = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    raise error
+                results[key] = future.result()
+                for dependent in dependents[key]:
+                    if dependent not in waiting:
+                        continue
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        submit(dependent)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    if len(results) != len(object_keys):
+        unresolved = [key for key in object_keys if key not in results]
+        raise ValueError(f"Circular references between objects: {unresolved}")
+
+    return results
@@ -0,0 +1,205 @@
+# A daemon that keeps an interpreter with bombilla (and any heavy module given to preload) imported, and runs
+# requests sent over a unix domain socket. Every request runs in a child forked from the daemon, so nothing a
+# run creates or imports leaks into the next one.
+# A request is one json object, the client half-closes the connection after it and reads one json response:
+#   {"command": "execute", "config": "experiment.json" or {...}, "type": "train", "root_module": "", "cwd": "..."}
+#   {"command": "generate_full_dict", "config": ...}
+#   {"command": "metadata", "node": {"module": ..., "class_name": ...}}
+#   {"command": "ping"}, {"command": "shutdown"}
+# Responses are {"status": 0, "result": ..., "output": "..."} or {"status": 1, "error": "<traceback>", ...}
+
+import os
+import sys
+import json
+import signal
+import socket
+import tempfile
+import importlib
+import traceback
+from typing import Any, Optional, Sequence
+
+from .bombilla import Bombilla
+from .node import Node, load_node
+from .utils.metadata import flush_metadata
+from .utils import config_cache
+
+COMMANDS = ("execute", "generate_full_dict", "metadata", "ping", "shutdown")
+
+
+def default_socket_path() -> str:
+    return os.environ.get(
+        "BOMBILLA_SOCKET", os.path.join(config_cache.settings["directory"], "serve.sock")
+    )
+
+
+def serve(socket_path: Optional[str] = None, preload: Sequence[str] = ()):
+    socket_path = socket_path or default_socket_path()
+    for module in preload:
+        importlib.import_module(module)
+
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+    if os.path.exists(socket_path):
+        # a socket nobody answers on is left over by a daemon that died
+        assert not ping(socket_path), f"A daemon is already serving on {socket_path}"
+        os.unlink(socket_path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    server.listen(64)
+    previous_handlers = (
+        signal.signal(signal.SIGCHLD, _reap_children),
+        signal.signal(signal.SIGTERM, _stop),
+    )
+    print(f"bomba serving on {socket_path}", flush=True)
+    try:
+        while True:
+            # the request is read by the forked child, a client that stalls holds up only its own child
+            connection, _ = server.accept()
+            with connection:
+                _fork_request(connection, server)
+    except _Shutdown:
+        pass
+    finally:
+        signal.signal(signal.SIGCHLD, previous_handlers[0])
+        signal.signal(signal.SIGTERM, previous_handlers[1])
+        server.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+class _Shutdown(Exception):
+    pass
+
+
+def _stop(signum, frame):
+    # SIGTERM, sent by the child that got a shutdown request (or by anyone else), stops the daemon
+    raise _Shutdown()
+
+
+def _fork_request(connection: socket.socket, server: socket.socket):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    daemon = os.getpid()
+    pid = os.fork()
+    if pid != 0:
+        return
+    status = 1
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        server.close()
+        # a client that doesn't send its request doesn't keep the child for long
+        connection.settimeout(30)
+        try:
+            payload = json.loads(_receive(connection))
+            assert isinstance(payload, dict), "The request must be a json object"
+            command = payload.get("command")
+            assert command in COMMANDS, f"Unknown command {command}, use one of {COMMANDS}"
+        except Exception as err:
+            _send(connection, {"status": 1, "error": f"Invalid request: {err}"})
+        else:
+            connection.settimeout(None)
+            if command == "shutdown":
+                _send(connection, {"status": 0, "result": None})
+                os.kill(daemon, signal.SIGTERM)
+            else:
+                _send(connection, handle_request(payload))
+        status = 0
+    finally:
+        os._exit(status)
+
+
+def _reap_children(signum, frame):
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+
+def handle_request(payload: dict) -> dict[str, Any]:
+    # runs in the forked child, what the run prints is sent back with the response
+    response: dict[str, Any] = {"pid": os.getpid()}
+    with tempfile.TemporaryFile() as output:
+        stdout, stderr = os.dup(1), os.dup(2)
+        os.dup2(output.fileno(), 1)
+        os.dup2(output.fileno(), 2)
+        try:
+            if payload.get("cwd"):
+                os.chdir(payload["cwd"])
+            response["result"] = run_command(payload)
+            response["status"] = 0
+        except BaseException as err:
+            response["status"] = 1
+            response["error"] = "".join(traceback.format_exception(err))
+        finally:
+            flush_metadata()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(stdout, 1)
+            os.dup2(stderr, 2)
+            os.close(stdout)
+            os.close(stderr)
+        output.seek(0)
+        response["output"] = output.read().decode(errors="replace")
+    return response
+
+
+def run_command(payload: dict) -> Any:
+    command = payload["command"]
+    root_module = payload.get("root_module", "")
+    if command == "ping":
+        return "pong"
+    elif command == "metadata":
+        # as `bomba metadata`
+        Node.set_config(root_module, {})
+        node = load_node(dict(payload["node"]))
+        node.__load__()
+        return node.generate_full_dict()
+
+    config = payload.get("config")
+    if isinstance(config, str):
+        bombilla = Bombilla.from_file(config, root_module, {}, cache=payload.get("cache", False))
+    else:
+        assert isinstance(config, dict), "config must be a file name or a config dict"
+        bombilla = Bombilla(config, root_module, {})
+    if command == "generate_full_dict":
+        return bombilla.generate_full_dict()
+    bombilla.load()
+    return bombilla.execute(payload.get("type", "train"), max_workers=payload.get("max_workers"))
+
+
+def request(payload: dict, socket_path: Optional[str] = None) -> dict[str, Any]:
+    # sends one request to the daemon and waits for its response, relative paths are resolved by the
+    # daemon from the working directory of the caller
+    payload = dict(payload)
+    payload.setdefault("cwd", os.getcwd())
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path or default_socket_path())
+        connection.sendall(json.dumps(payload).encode())
+        connection.shutdown(socket.SHUT_WR)
+        return json.loads(_receive(connection))
+
+
+def ping(socket_path: Optional[str] = None) -> bool:
+    try:
+        return request({"command": "ping"}, socket_path).get("result") == "pong"
+    except OSError:
+        return False
+
+
+def _receive(connection: socket.socket) -> bytes:
+    chunks = []
+    while True:
+        chunk = connection.recv(1 << 16)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+def _send(connection: socket.socket, response: dict):
+    # results that aren't json are sent as their repr
+    connection.sendall(json.dumps(response, default=repr).encode())
@@ -0,0 +1,215 @@
+# Hyperparameter sweeps over a base config. A sweep is a list of axes, every variant is a small set of overrides
+# ({"objects.optimizer.params.lr": 0.01, ...}) applied copy-on-write to the base config when it is used, so
+# variants are generated lazily and a grid of any size costs no memory up front.
+
+import math
+import json
+import random
+import hashlib
+from typing import Any, Iterator, Optional, Sequence, Union
+
+from .bombilla import Bombilla
+from .utils.overrides import override_config, split_path
+
+
+def config_path(path: str) -> str:
+    # "optimizer.params.lr" addresses the params of the object optimizer, paths can also start at the root
+    # of the config ("objects.optimizer.params.lr", "experiment.train.0.params.epochs")
+    head = split_path(path)[0]
+    return path if head in ("objects", "experiment") else "objects." + path
+
+
+def object_paths(config: Any) -> dict[str, tuple]:
+    # object key -> path in the config of the keyed objects nested in other objects (the first one found)
+    paths: dict[str, tuple] = {}
+
+    def walk(value: Any, path: tuple):
+        if isinstance(value, dict):
+            if isinstance(value.get("object_key"), str) and len(path) > 2:
+                paths.setdefault(value["object_key"], path)
+            for key, val in value.items():
+                walk(val, path + (key,))
+        elif isinstance(value, list):
+            for index, item in enumerate(value):
+                walk(item, path + (str(index),))
+
+    walk(config, ())
+    return paths
+
+
+class Axis:
+    path: str = ""
+
+    def __init__(self, path: str):
+        self.path = config_path(path)
+
+
+class Grid(Axis):
+    # every one of values, combined with every point of the other grid axes
+    def __init__(self, path: str, values: Sequence[Any]):
+        super().__init__(path)
+        assert len(values) > 0, f"Axis {path} has no values"
+        self.values = list(values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def point(self, index: int) -> dict[str, Any]:
+        return {self.path: self.values[index]}
+
+
+class Explicit:
+    # listed points, each one a dict of overrides ({"optimizer.params.lr": 0.1, "data.params.batch_size": 64})
+    def __init__(self, points: Sequence[dict[str, Any]]):
+        assert len(points) > 0, "No points given"
+        self.points = [
+            {config_path(path): value for path, value in point.items()} for point in points
+        ]
+
+    def __len__(self):
+        return len(self.points)
+
+    def point(self, index: int) -> dict[str, Any]:
+        return self.points[index]
+
+
+class Uniform(Axis):
+    # random axes are sampled again for each of the samples of every grid point
+    def __init__(self, path: str, low: float, high: float):
+        super().__init__(path)
+        self.low = low
+        self.high = high
+
+    def sample(self, rng: random.Random) -> Any:
+        return rng.uniform(self.low, self.high)
+
+
+class LogUniform(Uniform):
+    def __init__(self, path: str, low: float, high: float):
+        assert low > 0 and high > 0, f"Axis {path} must have positive bounds"
+        super().__init__(path, low, high)
+
+    def sample(self, rng: random.Random) -> Any:
+        return math.exp(rng.uniform(math.log(self.low), math.log(self.high)))
+
+
+class Choice(Axis):
+    def __init__(self, path: str, values: Sequence[Any]):
+        super().__init__(path)
+        assert len(values) > 0, f"Axis {path} has no values"
+        self.values = list(values)
+
+    def sample(self, rng: random.Random) -> Any:
+        return rng.choice(self.values)
+
+
+SweepAxis = Union[Grid, Explicit, Uniform, Choice]
+
+
+def variant_id(overrides: dict[str, Any]) -> str:
+    # the same overrides always give the same id, whatever their order
+    content = json.dumps(overrides, sort_keys=True, default=repr)
+    return hashlib.sha1(content.encode()).hexdigest()[:12]
+
+
+class Variant:
+    def __init__(self, sweep: "Sweep", index: int, overrides: dict[str, Any]):
+        self.sweep = sweep
+        self.index = index
+        self.overrides = overrides
+        self.id = variant_id(overrides)
+
+    def config(self) -> dict:
+        return override_config(self.sweep.config, self.overrides)
+
+    def bombilla(self, object_key_map: Optional[dict] = None) -> Bombilla:
+        # every variant gets its own key map, objects of a variant never leak into the next one
+        return Bombilla(
+            self.config(),
+            self.sweep.root_module,
+            object_key_map if object_key_map is not None else {},
+        )
+
+    def execute(
+        self,
+        type: str = "train",
+        object_key_map: Optional[dict] = None,
+        max_workers: Optional[int] = None,
+    ):
+        bombilla = self.bombilla(object_key_map)
+        bombilla.load()
+        return bombilla.execute(type, max_workers=max_workers)
+
+    def __repr__(self):
+        return f"Variant({self.id}, {self.overrides})"
+
+
+class Sweep:
+    def __init__(
+        self,
+        base: Union[Bombilla, dict],
+        axes: Sequence[SweepAxis],
+        samples: int = 1,
+        seed: int = 0,
+        root_module: str = "",
+    ):
+        if isinstance(base, Bombilla):
+            self.config = base._config
+            self.root_module = base._root_module
+        else:
+            self.config = base
+            self.root_module = root_module
+        self.grid_axes = [axis for axis in axes if isinstance(axis, (Grid, Explicit))]
+        self.random_axes = [axis for axis in axes if not isinstance(axis, (Grid, Explicit))]
+        # random axes are sampled `samples` times per grid point, without random axes once is enough
+        self.samples = samples if self.random_axes else 1
+        self.seed = seed
+
+        # paths of objects nested in others ("optimizer.params.lr" with optimizer in model.params) are
+        # resolved to where the object is in the config
+        nested = object_paths(self.config)
+        for axis in axes:
+            if isinstance(axis, Explicit):
+                axis.points = [
+                    {self.__resolve(path, nested): value for path, value in point.items()}
+                    for point in axis.points
+                ]
+            else:
+                axis.path = self.__resolve(axis.path, nested)
+
+    def __resolve(self, path: str, nested: dict[str, tuple]) -> str:
+        keys = split_path(path)
+        if keys[0] != "objects" or keys[1] in self.config.get("objects", {}):
+            return path
+        assert keys[1] in nested, f"Sweep axis {path}: no object {keys[1]}"
+        return ".".join(nested[keys[1]] + keys[2:])
+
+    def __len__(self):
+        return math.prod(len(axis) for axis in self.grid_axes) * self.samples
+
+    def __getitem__(self, index: int) -> Variant:
+        # variants can be picked by index, e.g. one slice of the sweep per worker
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Variant {index} out of range")
+
+        point = index // self.samples
+        # mixed radix, the last axis changes fastest
+        positions = []
+        for axis in reversed(self.grid_axes):
+            point, position = divmod(point, len(axis))
+            positions.append(position)
+
+        overrides: dict[str, Any] = {}
+        for axis, position in zip(self.grid_axes, reversed(positions)):
+            overrides.update(axis.point(position))
+        if self.random_axes:
+            rng = random.Random(f"{self.seed}:{index}")
+            for axis in self.random_axes:
+                overrides[axis.path] = axis.sample(rng)
+        return Variant(self, index, overrides)
+
+    def __iter__(self) -> Iterator[Variant]:
+        for index in range(len(self)):
+            yield self[index]
@@ -1 +1,6 @@
-from .utils import get_function_args, parse_docs
+from .utils import (
+    get_function_args,
+    parse_docs,
+    clear_introspection_cache,
+    introspection_cache_size,
+)
@@ -1,7 +1,6 @@
 from types import SimpleNamespace
 
 import json
-import ipdb
 
 
 class Bunch(dict):
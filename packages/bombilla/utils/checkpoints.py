@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import tempfile
+import threading
+import warnings
+from typing import Any, Callable, Optional
+
+from . import config_cache
+from .template import compile_template
+
+# Content addressed cache of built objects, for the nodes with "cache": true. An object is stored under the
+# fingerprint of its node: a hash of its config where every referenced object is replaced by the fingerprint
+# of that object, so a change anywhere upstream gives a new key. Objects are pickled to
+# <cache directory>/objects/<fingerprint>.pkl, next to a small <fingerprint>.json describing the entry.
+# Hits refresh the modification time of the entry, the least recently used entries are evicted once the
+# cache grows over max_size bytes.
+
+settings = {
+    "max_size": 10 * 2**30,
+}
+
+_lock = threading.Lock()
+
+# keys that name nodes or configure them, they don't change what is built
+IGNORED_KEYS = ("object_key", "cache", "shared")
+
+
+def configure_checkpoints(**kwargs):
+    for key in kwargs:
+        assert key in settings, f"Unknown checkpoint setting {key}"
+    settings.update(kwargs)
+
+
+def checkpoint_directory() -> str:
+    return os.path.join(config_cache.settings["directory"], "objects")
+
+
+def fingerprint(args: Any, resolve: Callable[[str], Optional[str]]) -> Optional[str]:
+    # resolve gives the fingerprint of a referenced object key, None when it is unknown (then so is this one)
+    missing = []
+
+    def reference(key: str) -> Optional[str]:
+        value = resolve(key)
+        if value is None:
+            missing.append(key)
+        return value
+
+    def canonical(value: Any) -> Any:
+        if isinstance(value, dict):
+            return {
+                key: reference(val) if key == "reference_key" else canonical(val)
+                for key, val in value.items()
+                if key not in IGNORED_KEYS
+            }
+        elif isinstance(value, (list, tuple)):
+            return [canonical(item) for item in value]
+        elif isinstance(value, str):
+            template = compile_template(value)
+            if template is None:
+                return value
+            return {
+                "template": [
+                    segment if i % 2 == 0 else reference(segment)
+                    for i, segment in enumerate(template.segments)
+                ]
+            }
+        return value
+
+    content = json.dumps(canonical(args), sort_keys=True, default=repr)
+    if missing:
+        return None
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def nested_object_keys(args: Any) -> list[str]:
+    # object keys of the objects nested in a node's config (not its own key). A node whose built object is
+    # reused doesn't build them, so nothing would register them in the key map
+    keys = []
+
+    def walk(value: Any, nested: bool):
+        if isinstance(value, dict):
+            if nested and isinstance(value.get("object_key"), str):
+                keys.append(value["object_key"])
+            for val in value.values():
+                walk(val, True)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                walk(item, True)
+
+    walk(args, False)
+    return keys
+
+
+def value_fingerprint(value: Any) -> Optional[str]:
+    # for plain values that were put in the key map directly (e.g. save_dir)
+    if isinstance(value, (str, int, float, bool, type(None))):
+        return hashlib.sha256(json.dumps(["value", value]).encode()).hexdigest()
+    return None
+
+
+def load_checkpoint(key: str) -> tuple[bool, Any]:
+    path = os.path.join(checkpoint_directory(), key + ".pkl")
+    try:
+        with open(path, "rb") as f:
+            obj = pickle.load(f)
+    except FileNotFoundError:
+        return False, None
+    except Exception as err:
+        warnings.warn(f"Ignoring unreadable checkpoint {path}: {err}")
+        return False, None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return True, obj
+
+
+def store_checkpoint(key: str, obj: Any, description: Optional[dict] = None):
+    directory = checkpoint_directory()
+    try:
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as err:
+        warnings.warn(f"Can't cache {type(obj).__name__} object: {err}")
+        return
+    os.makedirs(directory, exist_ok=True)
+    __write(os.path.join(directory, key + ".json"), json.dumps(
+        dict(description or {}, size=len(data), created=time.time())
+    ).encode())
+    __write(os.path.join(directory, key + ".pkl"), data)
+    evict_checkpoints()
+
+
+def __write(path: str, data: bytes):
+    # written next to the entry and moved over it
+    fd, tmp_path = tempfile.mkstemp(prefix=".checkpoint.", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def checkpoint_entries() -> list[dict[str, Any]]:
+    # the entries of the cache, least recently used first
+    directory = checkpoint_directory()
+    if not os.path.isdir(directory):
+        return []
+    entries = []
+    for filename in os.listdir(directory):
+        if not filename.endswith(".pkl"):
+            continue
+        key = filename[: -len(".pkl")]
+        try:
+            stat = os.stat(os.path.join(directory, filename))
+        except FileNotFoundError:
+            continue
+        entry = {"key": key, "size": stat.st_size, "last_used": stat.st_mtime}
+        try:
+            with open(os.path.join(directory, key + ".json"), "r") as f:
+                entry["description"] = json.load(f)
+        except (OSError, ValueError):
+            entry["description"] = {}
+        entries.append(entry)
+    return sorted(entries, key=lambda entry: entry["last_used"])
+
+
+def checkpoints_size() -> int:
+    return sum(entry["size"] for entry in checkpoint_entries())
+
+
+def remove_checkpoint(key: str):
+    for suffix in (".pkl", ".json"):
+        try:
+            os.unlink(os.path.join(checkpoint_directory(), key + suffix))
+        except FileNotFoundError:
+            pass
+
+
+def evict_checkpoints(max_size: Optional[int] = None):
+    max_size = settings["max_size"] if max_size is None else max_size
+    with _lock:
+        entries = checkpoint_entries()
+        size = sum(entry["size"] for entry in entries)
+        for entry in entries:
+            if size <= max_size:
+                break
+            remove_checkpoint(entry["key"])
+            size -= entry["size"]
+
+
+def purge_checkpoints(keys: Optional[list[str]] = None):
+    # all the entries without keys
+    for key in keys if keys is not None else [entry["key"] for entry in checkpoint_entries()]:
+        remove_checkpoint(key)
@@ -0,0 +1,98 @@
+import os
+import sys
+import marshal
+import hashlib
+import tempfile
+from typing import Any, Optional
+
+# On-disk cache of the normalized form (BombillaDAG.to_dict) of config files, so that launching the same config
+# again skips parsing it and building a DAG for it. Entries are keyed by a hash of the contents of the config,
+# the interpreter and the bombilla version, any change to one of them misses the cache.
+# Entries are written with marshal (configs only hold plain python values) and replaced atomically.
+
+settings = {
+    "directory": os.environ.get(
+        "BOMBILLA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "bombilla")
+    ),
+}
+
+_version: Optional[str] = None
+
+
+def configure_config_cache(**kwargs):
+    for key in kwargs:
+        assert key in settings, f"Unknown config cache setting {key}"
+    settings.update(kwargs)
+
+
+def cache_directory() -> str:
+    return os.path.join(settings["directory"], "configs")
+
+
+def bombilla_version() -> str:
+    # the installed version, and the modification times of the parser sources for development checkouts
+    global _version
+    if _version is None:
+        from importlib import metadata
+
+        try:
+            version = metadata.version("bomba")
+        except metadata.PackageNotFoundError:
+            version = "dev"
+        package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        sources = [
+            os.path.join(package, "parser.py"),
+            os.path.join(package, "bombilla_dag", "bombilla_dag.py"),
+            os.path.join(package, "bombilla_dag", "dag.py"),
+            os.path.join(package, "bombilla_dag", "nodes.py"),
+        ]
+        mtimes = [str(os.stat(s).st_mtime_ns) for s in sources if os.path.exists(s)]
+        _version = version + "-" + "-".join(mtimes)
+    return _version
+
+
+def config_key(source: bytes, kind: str) -> str:
+    digest = hashlib.sha256()
+    for part in (kind.encode(), sys.version.encode(), bombilla_version().encode(), source):
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def load_config(key: str) -> Optional[dict[str, Any]]:
+    try:
+        with open(os.path.join(cache_directory(), key + ".marshal"), "rb") as f:
+            config = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        # missing or unreadable entries are parsed again
+        return None
+    return config if isinstance(config, dict) else None
+
+
+def store_config(key: str, config: dict[str, Any]):
+    try:
+        data = marshal.dumps(config)
+    except ValueError:
+        # holds values marshal can't write, it is not cached
+        return
+    directory = cache_directory()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".config.", suffix=".tmp", dir=directory)
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(directory, key + ".marshal"))
+    except OSError:
+        os.unlink(tmp_path)
+
+
+def clear_config_cache():
+    directory = cache_directory()
+    if not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        if filename.endswith(".marshal"):
+            os.unlink(os.path.join(directory, filename))
@@ -0,0 +1,8 @@
+import sys
+
+
+def set_trace():
+    # ipdb (and IPython with it) is only imported when a debugger is actually started
+    import ipdb
+
+    ipdb.set_trace(sys._getframe().f_back)
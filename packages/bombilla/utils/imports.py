@@ -0,0 +1,129 @@
+import sys
+import importlib.util
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Iterable, Optional
+
+# Process wide cache of module resolutions. Both hits and misses are remembered, so that a module
+# referenced many times by a config is not probed again with failing imports.
+# Reads and writes are single dict operations, concurrent resolutions at worst import the same module twice.
+
+_MISSING = object()
+_UNKNOWN = object()
+
+# (candidate module names, symbol) -> imported module or _MISSING
+_resolved: dict[tuple[tuple[str, ...], Optional[str]], Any] = {}
+# candidate module names -> the first one that exists, or None if none of them does
+_found: dict[tuple[str, ...], Optional[str]] = {}
+# (candidate module names, symbol) -> import running in the background
+_prefetching: dict[tuple[tuple[str, ...], Optional[str]], Future] = {}
+_prefetcher: Optional[ThreadPoolExecutor] = None
+
+
+def module_candidates(module: str, root_module: Optional[str] = "") -> tuple[str, ...]:
+    # a module is looked up globally first, then relative to the root module
+    if root_module:
+        return (module, root_module + "." + module)
+    return (module,)
+
+
+def resolve_module(candidates: tuple[str, ...], symbol: Optional[str] = None) -> Any:
+    key = (candidates, symbol)
+    module = _resolved.get(key)
+    if module is _MISSING:
+        raise ModuleNotFoundError(f'Module "{candidates[0]}" not found')
+    if module is not None:
+        return module
+
+    found = _found.get(candidates, _UNKNOWN)
+    if found is _UNKNOWN:
+        names = candidates
+    else:
+        names = (found,) if found is not None else ()
+
+    fromlist = [symbol] if symbol else []
+    for name in names:
+        try:
+            module = __import__(name, fromlist=fromlist)
+            break
+        except ModuleNotFoundError as err:
+            # the module exists but one of its own imports is missing
+            if err.name != None and err.name.split(".")[0] != name.split(".")[0]:
+                raise err
+
+    if module is None:
+        _resolved[key] = _MISSING
+        raise ModuleNotFoundError(f'Module "{candidates[0]}" not found')
+
+    _resolved[key] = module
+    return module
+
+
+def find_module_names(modules: Iterable[tuple[str, ...]]):
+    # resolves which candidate name each module has (with importlib.util.find_spec), so that later imports go
+    # straight to the right name. The modules themselves are not imported, but find_spec("a.b.c") imports the
+    # parent packages a and a.b, so resolving can run their __init__ code
+    for candidates in modules:
+        if candidates in _found:
+            continue
+        found = None
+        for name in candidates:
+            exists = __spec_exists(name)
+            if exists is None:
+                found = _UNKNOWN
+                break
+            if exists:
+                found = name
+                break
+        if found is not _UNKNOWN:
+            _found[candidates] = found
+
+
+def __spec_exists(name: str) -> Optional[bool]:
+    # None when it can't be told without importing the module
+    if name in sys.modules:
+        return True
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError as err:
+        # a parent package is missing
+        if err.name != None and (name + ".").startswith(err.name + "."):
+            return False
+        return None
+    except Exception:
+        return None
+
+
+def prefetch_modules(
+    modules: Iterable[tuple[tuple[str, ...], Optional[str]]], max_workers: int = 4
+) -> list[Future]:
+    # imports the modules on background threads, a later resolve_module of a module being imported
+    # waits for it on the import lock and then finds it in sys.modules
+    global _prefetcher
+    if _prefetcher is None:
+        _prefetcher = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="bombilla-import"
+        )
+    futures = []
+    for candidates, symbol in modules:
+        key = (candidates, symbol)
+        if key in _resolved:
+            continue
+        if key not in _prefetching:
+            _prefetching[key] = _prefetcher.submit(__prefetch, candidates, symbol)
+        futures.append(_prefetching[key])
+    return futures
+
+
+def __prefetch(candidates: tuple[str, ...], symbol: Optional[str]):
+    try:
+        find_module_names([candidates])
+        resolve_module(candidates, symbol)
+    except Exception:
+        # raised again when the module is loaded for real
+        pass
+
+
+def clear_module_cache():
+    _resolved.clear()
+    _found.clear()
+    _prefetching.clear()
@@ -1,56 +1,231 @@
-import ipdb
 import json
 import os
+import stat
+import atexit
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # no file locks on this platform
+    fcntl = None
+
+# Metadata of the created objects is buffered in memory and written once per execution (flush_metadata),
+# or every flush_interval seconds. metadata.json is replaced atomically.
+# With shared=True, several processes can write the same metadata.json: every process appends its updates
+# to its own records file (metadata.json.<host>.<pid>.jsonl), which compact_metadata merges later.
+
+settings = {
+    "enabled": True,
+    "max_depth": 2,  # how deep returned tuples and lists are introspected
+    "max_items": 16,  # how many elements of a returned tuple or list are introspected
+    "flush_interval": None,
+    "shared": False,
+}
+
+# metadata.json path -> {(kind, name): returns}, later updates of the same export replace earlier ones
+_pending: dict[str, dict[tuple[str, str], dict]] = {}
+_paths: dict[tuple[str, str], str] = {}
+_lock = threading.RLock()
+_timer: threading.Timer | None = None
+
+
+def configure_metadata(**kwargs):
+    for key in kwargs:
+        assert key in settings, f"Unknown metadata setting {key}"
+    settings.update(kwargs)
+    _paths.clear()
+
+
+def metadata_enabled():
+    return settings["enabled"]
 
 
 def generate_metadata(obj, metadata, root_module=""):
 
+    if not settings["enabled"]:
+        return
+
+    path = find_metadata(metadata, root_module)
+    if not path:
+        return
+
     return_meta = __generate_metadata(obj, metadata)
 
-    save_metadata(return_meta, metadata, root_module)
-    # ipdb.set_trace()
+    save_metadata(return_meta, metadata, root_module, path)
 
 
-def save_metadata(return_meta, meta, root_module=""):
+def save_metadata(return_meta, meta, root_module="", path=None):
 
-    # ipdb.set_trace()
+    path = path or find_metadata(meta, root_module)
 
-    path = find_metadata(meta, root_module)
+    if not path:
+        return
 
-    if path:
-        update_metadata(return_meta, meta, path)
+    if "function" in meta:
+        key = ("function", meta["function"])
+    elif "class_name" in meta:
+        key = ("class_name", meta["class_name"])
+    else:
+        return
+
+    global _timer
+    with _lock:
+        _pending.setdefault(path, {})[key] = return_meta
+        if settings["flush_interval"] and _timer is None:
+            _timer = threading.Timer(settings["flush_interval"], flush_metadata)
+            _timer.daemon = True
+            _timer.start()
+
+
+def _hostname() -> str:
+    import socket
+
+    return socket.gethostname()
+
+
+def flush_metadata():
+    global _timer
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+
+        for path, updates in pending.items():
+            if settings["shared"]:
+                append_records(path, updates)
+            else:
+                with file_lock(path):
+                    meta = read_metadata(path)
+                    for (kind, name), return_meta in updates.items():
+                        apply_update(meta, kind, name, return_meta)
+                    write_metadata(meta, path)
 
 
 def update_metadata(return_meta, obj_meta, path):
 
-    with open(path, "r") as f:
-        meta = json.load(f)
+    with _lock, file_lock(path):
+        meta = read_metadata(path)
 
         if "function" in obj_meta:
-            for f in meta["exports"]["functions"]:
-                if f["function_name"] == obj_meta["function"]:
-                    f["returns"] = return_meta
-                    break
-
+            apply_update(meta, "function", obj_meta["function"], return_meta)
         elif "class_name" in obj_meta:
-            for c in meta["exports"]["classes"]:
-                if c["class_name"] == obj_meta["class_name"]:
-                    c["returns"] = return_meta
-                    # ipdb.set_trace()
+            apply_update(meta, "class_name", obj_meta["class_name"], return_meta)
 
-                    break
-        # ipdb.set_trace()
+        write_metadata(meta, path)
 
-    meta_json = json.dumps(meta, indent=4)
-    # ipdb.set_trace()
+    # find the correct function with same module
 
-    # save to file
-    with open(path, "w") as f:
-        f.write(meta_json)
 
-    # ipdb.set_trace()
+def apply_update(meta, kind, name, return_meta):
 
-    # find the correct function with same module
+    if kind == "function":
+        for f in meta["exports"]["functions"]:
+            if f["function_name"] == name:
+                f["returns"] = return_meta
+                break
+
+    elif kind == "class_name":
+        for c in meta["exports"]["classes"]:
+            if c["class_name"] == name:
+                c["returns"] = return_meta
+                break
+
+
+def read_metadata(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_metadata(meta, path):
+    # written to a temporary file next to metadata.json, then moved over it
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix=".metadata.", suffix=".tmp", dir=directory)
+    try:
+        # mkstemp creates the file as 0600, the replaced metadata.json keeps its own mode
+        os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode) if os.path.exists(path) else 0o644)
+        with os.fdopen(fd, "w") as f:
+            f.write(json.dumps(meta, indent=4))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class file_lock:
+    # exclusive lock between processes on <path>.lock (a no-op where fcntl is not available)
+    def __init__(self, path):
+        self.path = path + ".lock"
+        self.fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+def records_path(path, pid=None):
+    return f"{path}.{_hostname()}.{pid or os.getpid()}.jsonl"
+
+
+def append_records(path, updates):
+    # every process only ever appends to its own records file
+    lines = [
+        json.dumps({"kind": kind, "name": name, "returns": return_meta}) + "\n"
+        for (kind, name), return_meta in updates.items()
+    ]
+    with open(records_path(path), "a") as f:
+        f.write("".join(lines))
+
+
+def compact_metadata(path):
+    # merges into metadata.json the records of this process and of the processes of this host that exited
+    prefix = os.path.basename(path) + "." + _hostname() + "."
+    directory = os.path.dirname(path) or "."
+
+    with _lock, file_lock(path):
+        records = []
+        for filename in sorted(os.listdir(directory)):
+            if not (filename.startswith(prefix) and filename.endswith(".jsonl")):
+                continue
+            pid = filename[len(prefix) : -len(".jsonl")]
+            if not pid.isdigit() or not (int(pid) == os.getpid() or not pid_alive(int(pid))):
+                continue
+            records.append(os.path.join(directory, filename))
+
+        if not records:
+            return
+
+        meta = read_metadata(path)
+        for record in records:
+            with open(record, "r") as f:
+                for line in f:
+                    if line.strip():
+                        update = json.loads(line)
+                        apply_update(meta, update["kind"], update["name"], update["returns"])
+        write_metadata(meta, path)
+
+        for record in records:
+            os.unlink(record)
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
 
 
 def find_metadata(meta, root):
@@ -58,11 +233,17 @@ def find_metadata(meta, root):
     if not "module" in meta:
         return None
 
+    # only the files found are cached, a metadata.json created later is still picked up
+    key = (meta["module"], root)
+    if key in _paths:
+        return _paths[key]
+
     path = [root] + meta["module"].split(".") + ["metadata.json"]
 
     path = os.path.join(*path)
 
     if os.path.exists(path):
+        _paths[key] = path
         return path
 
     path = [root] + meta["module"].split(".")[:-1] + ["metadata.json"]
@@ -70,12 +251,13 @@ def find_metadata(meta, root):
     path = os.path.join(*path)
 
     if os.path.exists(path):
+        _paths[key] = path
         return path
 
     return None
 
 
-def __generate_metadata(obj, metadata):
+def __generate_metadata(obj, metadata, depth=0):
 
     meta = {}
 
@@ -95,22 +277,16 @@ def __generate_metadata(obj, metadata):
         if shape is not None:
             meta["shape"] = str(shape)
 
-        if klass == tuple:
-            # generate metadata for each element in the tuple
+        if klass in (tuple, list) and depth < settings["max_depth"]:
+            # generate metadata for the first elements of the tuple or list
             metas = []
-            for i, element in enumerate(obj):
-                _meta = __generate_metadata(element, metadata)
+            for i, element in enumerate(obj[: settings["max_items"]]):
+                _meta = __generate_metadata(element, metadata, depth + 1)
                 metas.append(_meta)
 
             meta["return"] = metas
-
-        elif klass == list:
-            # generate metadata for each element in the list
-            metas = []
-            for i, element in enumerate(obj):
-                _meta = __generate_metadata(element, metadata)
-                metas.append(_meta)
-            meta["return"] = metas
+            if len(obj) > settings["max_items"]:
+                meta["length"] = len(obj)
 
     except:
         pass
@@ -123,3 +299,13 @@ def try_shape(obj):
         return obj.shape
     except:
         return None
+
+
+def __at_exit():
+    flush_metadata()
+    if settings["shared"]:
+        for path in {path for path in _paths.values() if path}:
+            compact_metadata(path)
+
+
+atexit.register(__at_exit)
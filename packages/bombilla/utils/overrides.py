@@ -0,0 +1,58 @@
+from typing import Any, Mapping, Union
+
+# A derived config shares every subtree it doesn't change with the config it is derived from: only the dicts
+# and lists on the path of an override are copied. Configs are not modified in place by bombilla (BombillaDAG
+# copies what it writes to, the runtime nodes don't write to them), so the shared subtrees stay valid as long
+# as the caller doesn't modify them either.
+
+Path = Union[str, tuple, list]
+
+
+class _Remove:
+    def __repr__(self):
+        return "REMOVE"
+
+
+# override value that removes the key (or list item) instead of setting it
+REMOVE = _Remove()
+
+
+def split_path(path: Path) -> tuple:
+    # "objects.model.params.lr" or ("objects", "model", "params", "lr"), list items by position ("callbacks.0")
+    return tuple(path.split(".")) if isinstance(path, str) else tuple(path)
+
+
+def override_config(config: dict, overrides: Mapping[Path, Any]) -> dict:
+    # containers copied by this call (kept alive here, so that their ids stay theirs) are written to in place,
+    # several overrides under the same dict copy it once
+    copies: dict[int, Any] = {}
+    result = config
+    for path, value in overrides.items():
+        keys = split_path(path)
+        assert len(keys) > 0, "Empty override path"
+        result = __override(result, keys, value, copies, path)
+    return result
+
+
+def __override(container: Any, keys: tuple, value: Any, copies: dict[int, Any], path: Path) -> Any:
+    key = keys[0]
+    if isinstance(container, list):
+        key = int(key)
+        assert -len(container) <= key < len(container), f"{path}: index {key} out of range"
+    else:
+        assert isinstance(container, dict), f"{path}: {key} is not in a dict or a list"
+        assert len(keys) == 1 or key in container, f"{path}: {key} not found"
+
+    if len(keys) > 1:
+        value = __override(container[key], keys[1:], value, copies, path)
+
+    if id(container) not in copies:
+        container = list(container) if isinstance(container, list) else dict(container)
+        copies[id(container)] = container
+
+    if value is REMOVE:
+        if isinstance(container, list) or key in container:
+            del container[key]
+    else:
+        container[key] = value
+    return container
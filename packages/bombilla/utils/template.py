@@ -0,0 +1,55 @@
+import re
+import functools
+from typing import Any, Mapping, Optional
+
+# Strings can refer to objects of the config with "{object_key}" placeholders. A string that is a single
+# placeholder resolves to the object itself, otherwise the objects are formatted into the string
+# ("{save_dir}/runs/{run_id}"). Templates are compiled once per distinct string and shared, the cache keeps the
+# most recently used ones so that long-lived processes (bomba serve, large sweeps) don't grow it without bound.
+
+PLACEHOLDER = re.compile(r"{(\w+)}")
+
+
+class Template:
+    __slots__ = ("source", "segments", "references")
+
+    def __init__(self, source: str, segments: tuple[str, ...]):
+        # segments alternate literals and references: literal, reference, literal, ..., literal
+        self.source = source
+        self.segments = segments
+        self.references = segments[1::2]
+
+    @property
+    def is_reference(self) -> bool:
+        return len(self.segments) == 3 and self.segments[0] == "" and self.segments[2] == ""
+
+    def resolve(self, values: Mapping[str, Any]) -> Any:
+        if self.is_reference:
+            return values[self.segments[1]]
+        return "".join(
+            segment if i % 2 == 0 else str(values[segment])
+            for i, segment in enumerate(self.segments)
+        )
+
+    def __repr__(self):
+        return f"Template({self.source!r})"
+
+
+def compile_template(value: str) -> Optional[Template]:
+    # None for strings without placeholders
+    if "{" not in value:
+        return None
+    return _compile_template(value)
+
+
+@functools.lru_cache(maxsize=2**16)
+def _compile_template(value: str) -> Optional[Template]:
+    segments = tuple(PLACEHOLDER.split(value))
+    return Template(value, segments) if len(segments) > 1 else None
+
+
+def references(value: Any) -> tuple[str, ...]:
+    if not isinstance(value, str):
+        return ()
+    template = compile_template(value)
+    return template.references if template is not None else ()
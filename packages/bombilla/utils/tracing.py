@@ -0,0 +1,145 @@
+import os
+import json
+import atexit
+import time
+import threading
+import functools
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+# Optional tracing of the node runtime, written as Chrome trace events (chrome://tracing or ui.perfetto.dev).
+# Every phase of a node is a span with the object key and the thread it ran on:
+#   import    Node.load_module
+#   params    NodeDict.__call__, the placeholders and params of a node resolved
+#   build     Object.__call__ and FunctionModuleCall.__call__
+#   method    MethodCall.__call__
+#   metadata  Node.generate_metadata
+#   step      ExperimentNode.execute_step, one step of the experiment
+# start_tracing wraps these methods and stop_tracing puts the originals back, so while tracing is off the
+# runtime runs exactly the code it runs without this module.
+# With BOMBILLA_TRACE=trace.json in the environment, everything from the first Bombilla on is traced and the
+# trace is written when the process exits.
+
+_events: list[dict] = []
+_thread_names: dict[int, str] = {}
+_lock = threading.Lock()
+_local = threading.local()
+# (class name, method name) -> original method, while tracing
+_originals: dict[tuple[str, str], Callable] = {}
+_start_ns = 0
+
+
+def _own_key(node: Any) -> Optional[str]:
+    if node.__dict__.get("object_key"):
+        return node.object_key
+    if node.__dict__.get("function_call"):
+        return f"{node.reference_key}.{node.function_call}"
+    return None
+
+
+def _traced_methods() -> list[tuple[type, str, str, Callable[..., Optional[str]]]]:
+    # (class, method, phase, key of the span from the arguments of the call)
+    from ..node import Node, NodeDict, Object, FunctionModuleCall, MethodCall, ExperimentNode
+
+    return [
+        (Node, "load_module", "import", lambda node, *args, **kwargs: _own_key(node)),
+        (NodeDict, "__call__", "params", lambda node, *args, **kwargs: _own_key(node)),
+        (Object, "__call__", "build", lambda node, *args, **kwargs: _own_key(node)),
+        (FunctionModuleCall, "__call__", "build", lambda node, *args, **kwargs: _own_key(node)),
+        (MethodCall, "__call__", "method", lambda node, *args, **kwargs: _own_key(node)),
+        (Node, "generate_metadata", "metadata", lambda node, *args, **kwargs: _own_key(node)),
+        (ExperimentNode, "execute_step", "step", lambda node, step, *args, **kwargs: _own_key(step)),
+    ]
+
+
+def _traced(method: Callable, phase: str, key_of: Callable[..., Optional[str]]) -> Callable:
+    @functools.wraps(method)
+    def traced(*args, **kwargs):
+        # spans without a key of their own (the params of an object) carry the key of the span around them
+        keys = _local.__dict__.setdefault("keys", [])
+        key = key_of(*args, **kwargs) or (keys[-1] if keys else None)
+        keys.append(key)
+        start = time.perf_counter_ns()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            end = time.perf_counter_ns()
+            keys.pop()
+            _record(phase, key, start, end)
+
+    return traced
+
+
+def _record(phase: str, key: Optional[str], start: int, end: int):
+    thread = threading.current_thread()
+    event = {
+        "name": f"{phase} {key}" if key else phase,
+        "cat": phase,
+        "ph": "X",
+        "ts": (start - _start_ns) / 1000,
+        "dur": (end - start) / 1000,
+        "pid": os.getpid(),
+        "tid": thread.ident,
+        "args": {"key": key},
+    }
+    with _lock:
+        _events.append(event)
+        _thread_names.setdefault(thread.ident, thread.name)
+
+
+def tracing_enabled() -> bool:
+    return bool(_originals)
+
+
+def start_tracing():
+    global _start_ns
+    if tracing_enabled():
+        return
+    with _lock:
+        _events.clear()
+        _thread_names.clear()
+    _start_ns = time.perf_counter_ns()
+    for cls, name, phase, key_of in _traced_methods():
+        method = cls.__dict__[name]
+        _originals[(cls.__name__, name)] = method
+        setattr(cls, name, _traced(method, phase, key_of))
+
+
+def stop_tracing(path: Optional[str] = None) -> list[dict]:
+    # the recorded events, written to path as a trace file when given
+    for cls, name, _, _ in _traced_methods():
+        if (cls.__name__, name) in _originals:
+            setattr(cls, name, _originals.pop((cls.__name__, name)))
+    with _lock:
+        events = list(_events)
+    if path is not None:
+        write_trace(path, events)
+    return events
+
+
+def write_trace(path: str, events: Optional[list[dict]] = None):
+    if events is None:
+        with _lock:
+            events = list(_events)
+    names = [
+        {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+        for tid, name in _thread_names.items()
+    ]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": names + events, "displayTimeUnit": "ms"}, f)
+
+
+def trace_until_exit(path: str):
+    if not tracing_enabled():
+        start_tracing()
+        atexit.register(stop_tracing, path)
+
+
+@contextmanager
+def trace(path: str) -> Iterator[None]:
+    # with trace("trace.json"): bombilla.load(); bombilla.execute()
+    start_tracing()
+    try:
+        yield
+    finally:
+        stop_tracing(path)
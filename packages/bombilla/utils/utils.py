@@ -1,15 +1,90 @@
-from typing import Callable
+from typing import TYPE_CHECKING, Any, Callable
+from collections import OrderedDict
 import inspect
-import ipdb
-from docstring_parser import (
-    Docstring,
-    DocstringMeta,
-    DocstringParam,
-    DocstringReturns,
-    DocstringStyle,
-    parse_from_object,
-)
-from docstring_parser.common import DocstringExample
+import threading
+
+if TYPE_CHECKING:
+    # docstring_parser is imported by parse_docs, the first time docstrings are needed
+    from docstring_parser import (
+        Docstring,
+        DocstringMeta,
+        DocstringParam,
+        DocstringReturns,
+    )
+    from docstring_parser.common import DocstringExample
+
+
+class IntrospectionCache:
+    """A bounded LRU cache of introspection results (signatures, parsed docstrings).
+
+    Entries are keyed by the identity and the qualified name of the callable. Bound methods are keyed by
+    their underlying function, so every instance of a class shares the same entry. The cache holds a
+    reference to the callables it stores, so their identity can't be reused while they are cached.
+
+    The cache is thread safe: lookups and insertions are done under a lock, the value is computed outside
+    of it, so two threads missing on the same callable at the same time may both compute it.
+
+    Args:
+        maxsize: Maximum number of entries, the least recently used ones are evicted first.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, obj: Any, compute: Callable[[Any], Any]) -> Any:
+        """Get the cached result for an object, computing it on a miss.
+
+        Args:
+            obj: Callable to look up.
+            compute: Function computing the result from the callable.
+
+        Returns:
+            The cached or computed result.
+        """
+        target = obj.__func__ if inspect.ismethod(obj) else obj
+        key = (id(target), getattr(target, "__qualname__", None), inspect.ismethod(obj))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is target:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        value = compute(obj)
+
+        with self._lock:
+            self._entries[key] = (target, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+signature_cache = IntrospectionCache()
+docstring_cache = IntrospectionCache()
+
+
+def clear_introspection_cache():
+    """Clear the cached signatures and parsed docstrings."""
+    signature_cache.clear()
+    docstring_cache.clear()
+
+
+def introspection_cache_size() -> int:
+    """Get the number of cached signatures and parsed docstrings.
+
+    Returns:
+        The number of entries in both caches.
+    """
+    return len(signature_cache) + len(docstring_cache)
 
 
 def parse_default_param(param):
@@ -41,7 +116,7 @@ def get_function_args(
     default = {}
     errors = []
 
-    for param_name, param in inspect.signature(function).parameters.items():
+    for param_name, param in signature_cache.get(function, inspect.signature).parameters.items():
         # only add parameters that are not self or exist in the params
 
         if param_name in params or param_name == "self":
@@ -91,14 +166,16 @@ def parse_docs(obj):
         The docstring for the object.
     """
 
-    doc = parse_from_object(obj)
+    from docstring_parser import DocstringStyle, parse_from_object
+
+    doc = docstring_cache.get(obj, parse_from_object)
 
     if doc.style != DocstringStyle.EPYDOC:
         return docstring_to_json(doc)
     return {}
 
 
-def docstring_to_json(doc: Docstring):
+def docstring_to_json(doc: "Docstring"):
     """Convert a docstring to a JSON representation.
 
     Args:
@@ -120,7 +197,7 @@ def docstring_to_json(doc: Docstring):
     return {k: v for k, v in res.items() if v}
 
 
-def example_to_json(example: DocstringExample):
+def example_to_json(example: "DocstringExample"):
     """Convert an example to a JSON representation.
 
     Args:
@@ -138,7 +215,7 @@ def example_to_json(example: DocstringExample):
     }
 
 
-def returons_to_json(returns: DocstringReturns):
+def returons_to_json(returns: "DocstringReturns"):
     """Convert a returns to a JSON representation.
 
     Args:
@@ -155,7 +232,7 @@ def returons_to_json(returns: DocstringReturns):
     }
 
 
-def meta_to_json(meta: DocstringMeta):
+def meta_to_json(meta: "DocstringMeta"):
     """Convert a meta to a JSON representation.
 
     Args:
@@ -170,7 +247,7 @@ def meta_to_json(meta: DocstringMeta):
     }
 
 
-def param_to_json(param: DocstringParam):
+def param_to_json(param: "DocstringParam"):
     """Convert a param to a JSON representation.
 
     Args: